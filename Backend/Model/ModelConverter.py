@@ -0,0 +1,115 @@
+import os
+import pickle
+import numpy as np
+import tensorflow as tf
+
+from Model.ModelPredictor import EnsemblePredictor, BucketedModel, metadata_filename
+
+PRECISIONS = ('float16', 'int8')
+
+
+class ModelConverter:
+    """Converts the float32 ensemble members to reduced-precision TFLite models for CPU inference"""
+
+    def __init__(self, model_dir='Model/Models/', tolerance=0.02):
+        self.model_dir = model_dir
+        # Largest allowed absolute difference between the float32 and converted deception scores
+        self.tolerance = tolerance
+        self.reference = EnsemblePredictor(model_dir)
+
+    def convert_model(self, model, precision, representative_windows):
+        """Convert one Keras model to a TFLite flatbuffer"""
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if precision == 'float16':
+            # Weights stored as float16, computation stays in float32
+            converter.target_spec.supported_types = [tf.float16]
+        elif precision == 'int8':
+            # int8 weights and activations, calibrated on the reference windows; inputs and outputs stay float32
+            def representative_dataset():
+                for window in representative_windows[:200]:
+                    yield [window[np.newaxis].astype(np.float32)]
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [
+                tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+                tf.lite.OpsSet.TFLITE_BUILTINS
+            ]
+        else:
+            raise ValueError(f"Unsupported precision: {precision}")
+        return converter.convert()
+
+    def convert(self, precision, reference_csv):
+        """Convert all ensemble members and activate the variant only if it passes the accuracy check"""
+        X = self.reference.preprocess_data(reference_csv, verbose=False)[0]
+        X = X.astype(np.float32)
+        print(f"Converting {len(self.reference.models)} models to {precision} using {len(X)} reference windows")
+
+        variant_dir = os.path.join(self.model_dir, precision)
+        os.makedirs(variant_dir, exist_ok=True)
+        model_paths = []
+        for model, path in zip(self.reference.models, self.reference.metadata['model_paths']):
+            # The reference members are pre-traced for batch buckets; the converter needs the Keras model itself
+            if isinstance(model, BucketedModel):
+                model = model.model
+            variant_path = os.path.join(precision, os.path.splitext(path)[0] + '.tflite')
+            with open(os.path.join(self.model_dir, variant_path), 'wb') as f:
+                f.write(self.convert_model(model, precision, X))
+            model_paths.append(variant_path)
+            print(f"- {path} -> {variant_path}")
+
+        # Write the variant metadata to a temporary file and only activate it if the scores match
+        metadata = dict(self.reference.metadata)
+        metadata.update({
+            'model_paths': model_paths,
+            'precision': precision,
+            'tolerance': self.tolerance,
+            'reference_data': os.path.basename(reference_csv)
+        })
+        metadata_path = os.path.join(self.model_dir, metadata_filename(precision))
+        candidate_path = metadata_path + '.candidate'
+        with open(candidate_path, 'wb') as f:
+            pickle.dump(metadata, f)
+
+        passed, max_error, agreement = self.check_accuracy(precision, X, candidate_path)
+        metadata.update({'max_score_error': max_error, 'decision_agreement': agreement})
+        print(f"{precision}: max score difference {max_error:.4f}, decision agreement {agreement * 100:.1f}% (tolerance {self.tolerance})")
+
+        os.remove(candidate_path)
+        if not passed:
+            # Refuse to activate the variant; remove any previously activated version as well
+            if os.path.exists(metadata_path):
+                os.remove(metadata_path)
+            print(f"{precision} variant exceeds the tolerance and was NOT activated")
+            return False
+
+        with open(metadata_path, 'wb') as f:
+            pickle.dump(metadata, f)
+        print(f"{precision} variant activated: {metadata_path}")
+        return True
+
+    def check_accuracy(self, precision, X, metadata_path):
+        """Compare deception scores of the converted ensemble against the float32 ensemble"""
+        expected, expected_binary, _ = self.reference.predict(X)
+        variant = EnsemblePredictor(self.model_dir, precision=precision, metadata_path=metadata_path)
+        actual, actual_binary, _ = variant.predict(X)
+
+        max_error = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+        agreement = float(np.mean(expected_binary == actual_binary)) if len(X) else 1.0
+        return max_error <= self.tolerance, max_error, agreement
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create reduced-precision versions of the ensemble models")
+    parser.add_argument("reference_csv", help="CSV file with reference action unit data used to check the converted models")
+    parser.add_argument("--precision", "-p", nargs="+", choices=PRECISIONS, default=list(PRECISIONS), help="Precisions to create (default: float16 int8)")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Maximum allowed difference in deception score (default: 0.02)")
+    parser.add_argument("--model-dir", default="Model/Models/", help="Directory containing the float32 models (default: Model/Models/)")
+
+    args = parser.parse_args()
+
+    converter = ModelConverter(args.model_dir, tolerance=args.tolerance)
+    failed = [precision for precision in args.precision if not converter.convert(precision, args.reference_csv)]
+    if failed:
+        raise SystemExit(f"Not activated: {', '.join(failed)}")
@@ -3,39 +3,184 @@ import pandas as pd
 import tensorflow as tf
 import pickle
 import os
+import threading
+import time
 import matplotlib.pyplot as plt
 from tensorflow.keras.models import load_model
+try:
+    from Model.Profiler import profiled
+except ImportError:
+    # Run as a script (python Model/ModelPredictor.py), with Model/ itself on the path
+    from Profiler import profiled
+
+def metadata_filename(precision='float32'):
+    """Metadata file of the ensemble at the given precision"""
+    if precision == 'float32':
+        return 'ensemble_metadata.pkl'
+    return f'ensemble_metadata_{precision}.pkl'
+
+
+class TFLiteModel:
+    """Runs a converted TFLite ensemble member with the same predict() interface as a Keras model"""
+    
+    def __init__(self, model_path):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch = None
+        # The interpreter's tensors are shared, so analyses running in other threads take turns
+        self.lock = threading.Lock()
+    
+    def predict(self, X, batch_size=None, verbose=0):
+        batch_size = batch_size or 256
+        outputs = []
+        with self.lock:
+            for start in range(0, len(X), batch_size):
+                batch = X[start:start + batch_size].astype(np.float32)
+                # Resize the input tensor only when the batch size changes
+                if len(batch) != self.batch:
+                    self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                    self.interpreter.allocate_tensors()
+                    self.batch = len(batch)
+                self.interpreter.set_tensor(self.input_index, batch)
+                self.interpreter.invoke()
+                outputs.append(self.interpreter.get_tensor(self.output_index).copy())
+        return np.concatenate(outputs)
+
+
+# pyplot draws on one global current figure, so plots of concurrent analyses are drawn one at a time
+_plot_lock = threading.Lock()
+
+
+# Batch sizes Keras ensemble members are run at; other batch sizes are padded up to one of these
+BATCH_BUCKETS = (1, 8, 32, 128, 512)
+
+
+class BucketedModel:
+    """Runs a Keras ensemble member on batches padded to a fixed set of bucket sizes.
+    
+    Each bucket has its own concrete function with a fixed (bucket, s_size, features) signature,
+    traced when the model is loaded, so no call retraces the graph whatever the number of windows
+    in a video. batch_size is ignored: inputs are split into buckets instead.
+    """
+    
+    def __init__(self, model, input_shape, buckets=BATCH_BUCKETS):
+        self.model = model
+        self.input_shape = tuple(input_shape)
+        self.buckets = sorted(buckets)
+        call = tf.function(lambda x: model(x, training=False))
+        self.functions = {
+            bucket: call.get_concrete_function(tf.TensorSpec((bucket,) + self.input_shape, tf.float32))
+            for bucket in self.buckets
+        }
+    
+    def warmup(self):
+        """Run every bucket once so the first real batch does not pay for graph setup"""
+        for bucket, function in self.functions.items():
+            function(tf.zeros((bucket,) + self.input_shape, tf.float32))
+    
+    def _split(self, n):
+        """Bucket sizes to run n windows with: the smallest bucket that fits, unless more than half of it would be padding"""
+        sizes = []
+        while n > 0:
+            bucket = next((b for b in self.buckets if b >= n), self.buckets[-1])
+            smaller = [b for b in self.buckets if b <= n]
+            if bucket > 2 * n and smaller:
+                bucket = smaller[-1]
+            sizes.append(bucket)
+            n -= min(bucket, n)
+        return sizes
+    
+    def predict(self, X, batch_size=None, verbose=0):
+        outputs = []
+        start = 0
+        for bucket in self._split(len(X)):
+            batch = np.asarray(X[start:start + bucket], dtype=np.float32)
+            padded = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+            padded[:len(batch)] = batch
+            outputs.append(self.functions[bucket](tf.constant(padded)).numpy()[:len(batch)])
+            start += len(batch)
+        if not outputs:
+            return np.zeros((0, 1), dtype=np.float32)
+        return np.concatenate(outputs)
+
 
 class EnsemblePredictor:
-    def __init__(self, model_dir='Model/Models/'):
-        # Load ensemble metadata
-        with open(os.path.join(model_dir, 'ensemble_metadata.pkl'), 'rb') as f:
-            self.metadata = pickle.load(f)
-        
-        # Load models
-        self.models = []
-        for path in self.metadata['model_paths']:
-            model_path = os.path.join(model_dir, path)
-            model = load_model(model_path)
-            self.models.append(model)
-        
+    """Loaded ensemble, shared by every analysis in the process.
+    
+    Results of a call are returned rather than stored on the predictor, so analyses in several
+    threads can use it at the same time.
+    """
+    
+    def __init__(self, model_dir='Model/Models/', precision='float32', metadata_path=None,
+                 cascade=False, cascade_confidence=None, cascade_audit=False, buckets=BATCH_BUCKETS,
+                 metadata=None, models=None):
+        # Load ensemble metadata; reduced-precision variants only exist once ModelConverter has activated them.
+        # metadata and models can also be given, e.g. by a client whose members run in another process.
+        if metadata is None:
+            metadata_path = metadata_path or os.path.join(model_dir, metadata_filename(precision))
+            if not os.path.exists(metadata_path):
+                raise FileNotFoundError(
+                    f"No {precision} ensemble found at {metadata_path}. Create it with: python -m Model.ModelConverter <reference_csv> --precision {precision}"
+                )
+            with open(metadata_path, 'rb') as f:
+                metadata = pickle.load(f)
+        self.metadata = metadata
+        self.precision = precision
         self.s_size = self.metadata['s_size']  # chunk size from training
-        print(f"Loaded {len(self.models)} models with chunk size {self.s_size}")
+        input_shape = self.metadata.get('input_shape', (self.s_size, 32))
+        
+        # Load models; Keras members are pre-traced for each batch bucket unless buckets is None
+        if models is None:
+            models = []
+            for path in self.metadata['model_paths']:
+                model_path = os.path.join(model_dir, path)
+                if model_path.endswith('.tflite'):
+                    model = TFLiteModel(model_path)
+                else:
+                    model = load_model(model_path)
+                    if buckets:
+                        model = BucketedModel(model, input_shape, buckets)
+                models.append(model)
+            print(f"Loaded {len(models)} {precision} models with chunk size {self.s_size}")
+        self.models = models
+        self.warmup()
+        
+        # Cascade mode evaluates members in order and stops a window early once its decision is fixed.
+        # cascade_confidence additionally stops once the partial mean reaches that confidence, and
+        # cascade_audit also computes the exact scores so both can be compared.
+        self.cascade = cascade
+        self.cascade_confidence = cascade_confidence
+        self.cascade_audit = cascade_audit
+    
+    def warmup(self):
+        """Run every pre-traced batch bucket once, so steady-state latency does not depend on the first video"""
+        bucketed = [model for model in self.models if isinstance(model, BucketedModel)]
+        if not bucketed:
+            return
+        start = time.perf_counter()
+        for model in bucketed:
+            model.warmup()
+        print(f"Warmed up batch buckets {bucketed[0].buckets} in {time.perf_counter() - start:.1f}s")
     
-    def preprocess_data(self, csv_file):
-        """Process input CSV file to match model input format"""
+    def preprocess_data(self, csv_file, verbose=True):
+        """Process input CSV file to match model input format.
+        
+        Returns the windows, their center frames, the number of frames and the fraction of frames with a face in each window."""
+        log = print if verbose else (lambda *args, **kwargs: None)
+        
         # Read the action units data
         data = pd.read_csv(csv_file, skipinitialspace=True)
         
         # Print initial data info
-        print(f"\n=== Input Data Info ===")
-        print(f"Total rows: {len(data)}")
-        print(f"Columns: {data.columns.tolist()}")
+        log(f"\n=== Input Data Info ===")
+        log(f"Total rows: {len(data)}")
+        log(f"Columns: {data.columns.tolist()}")
         
         # Validate data format
         if 'frame' in data.columns:
             data = data.sort_values('frame')  # Ensure frames are in order
-            print(f"Frames range: {data['frame'].min()} to {data['frame'].max()}")
+            log(f"Frames range: {data['frame'].min()} to {data['frame'].max()}")
         
         # Convert to numpy array (excluding header if necessary)
         first_row_check = pd.to_numeric(data.iloc[0], errors='coerce')
@@ -47,28 +192,35 @@ class EnsemblePredictor:
         if not au_columns:
             raise ValueError("No Action Unit columns found in the CSV file")
         
-        print(f"Number of AU features: {len(au_columns)}")
-        print(f"AU columns: {au_columns}")
+        log(f"Number of AU features: {len(au_columns)}")
+        log(f"AU columns: {au_columns}")
+        
+        # Per-frame face presence flag written by the AU cleaning step (all frames count if absent)
+        if 'face_present' in data.columns:
+            face_present = pd.to_numeric(data['face_present'], errors='coerce').fillna(0).values
+        else:
+            face_present = np.ones(len(data))
         
         data = data[au_columns].values
         
         # Verify chunk size
         if self.s_size != 30:
-            print(f"Warning: Expected chunk size of 30 frames, but got {self.s_size}")
+            log(f"Warning: Expected chunk size of 30 frames, but got {self.s_size}")
         
         # Reshape data into chunks of size s_size
         total_frames = len(data)
         num_chunks = total_frames // self.s_size
         remainder = total_frames % self.s_size
         
-        print(f"\n=== Chunking Info ===")
-        print(f"Total frames: {total_frames}")
-        print(f"Chunk size: {self.s_size}")
-        print(f"Number of complete chunks: {num_chunks}")
-        print(f"Remaining frames: {remainder}")
+        log(f"\n=== Chunking Info ===")
+        log(f"Total frames: {total_frames}")
+        log(f"Chunk size: {self.s_size}")
+        log(f"Number of complete chunks: {num_chunks}")
+        log(f"Remaining frames: {remainder}")
         
         chunks = []
         timestamps = []
+        face_coverage = []
         
         # Create overlapping chunks for better temporal analysis
         for i in range(num_chunks):
@@ -78,11 +230,12 @@ class EnsemblePredictor:
             
             # Validate chunk shape
             if chunk.shape[0] != self.s_size:
-                print(f"Warning: Chunk {i} has incorrect shape: {chunk.shape}")
+                log(f"Warning: Chunk {i} has incorrect shape: {chunk.shape}")
                 continue
                 
             chunks.append(chunk)
             timestamps.append(start_idx + self.s_size // 2)
+            face_coverage.append(face_present[start_idx:end_idx].mean())
         
         # Handle remaining frames
         if remainder > 0:
@@ -92,31 +245,45 @@ class EnsemblePredictor:
             padded_chunk = np.vstack((last_chunk, padding))
             chunks.append(padded_chunk)
             timestamps.append(total_frames - remainder // 2)
+            # Coverage of the padded chunk only counts the real frames
+            face_coverage.append(face_present[-remainder:].mean())
         
         # Convert list of chunks to a 3D numpy array
         X = np.array(chunks)
         
-        print(f"\n=== Final Output Shape ===")
-        print(f"Input shape: {X.shape}")
-        print(f"Number of chunks: {len(chunks)}")
-        print(f"Timestamps: {timestamps}")
+        log(f"\n=== Final Output Shape ===")
+        log(f"Input shape: {X.shape}")
+        log(f"Number of chunks: {len(chunks)}")
+        log(f"Timestamps: {timestamps}")
         
-        return X, timestamps, total_frames
+        # Fraction of frames with a detected face in each chunk, used to gate inference
+        return X, timestamps, total_frames, np.array(face_coverage)
     
-    def predict(self, X, deception_threshold=0.5):
+    def predict(self, X, deception_threshold=0.5, batch_size=None):
         """Make predictions using ensemble models"""
-        # Store raw probabilities from each model
-        raw_probabilities = np.zeros((len(X), len(self.models)))
+        deception_score, binary_predictions, confidence, _ = self.predict_windows(X, deception_threshold, batch_size, self.cascade)
+        return deception_score, binary_predictions, confidence
+    
+    @profiled("EnsemblePredictor.predict")
+    def predict_windows(self, X, deception_threshold=0.5, batch_size=None, cascade=False, verbose=True):
+        """Like predict, also returning the number of ensemble members evaluated for each window"""
+        if len(X) == 0:
+            return np.zeros(0), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0, dtype=int)
+        
+        if cascade:
+            deception_score, members_evaluated = self.predict_cascade(X, deception_threshold, batch_size, verbose)
+            binary_predictions = (deception_score > deception_threshold).astype(int)
+            confidence = 2 * np.abs(deception_score - 0.5)
+            return deception_score, binary_predictions, confidence, members_evaluated
         
-        # Get predictions from each model
-        for i, model in enumerate(self.models):
-            # Get raw probability scores
-            pred_prob = model.predict(X, verbose=0).flatten()
-            raw_probabilities[:, i] = pred_prob
-        print("The raw probabilities are:")
-        print(raw_probabilities)
+        # Store raw probabilities from each model
+        raw_probabilities = self.member_probabilities(X, batch_size)
+        if verbose:
+            print("The raw probabilities are:")
+            print(raw_probabilities)
         # Calculate deception score: average of all model probabilities
         deception_score = np.mean(raw_probabilities, axis=1)
+        members_evaluated = np.full(len(X), len(self.models))
         
         # Calculate binary predictions based on average probability
         binary_predictions = (deception_score > deception_threshold).astype(int)
@@ -124,32 +291,118 @@ class EnsemblePredictor:
         # Calculate confidence based on distance from 0.5 (most uncertain)
         confidence = 2 * np.abs(deception_score - 0.5)
         
-        return deception_score, binary_predictions, confidence
+        return deception_score, binary_predictions, confidence, members_evaluated
     
-    def predict_from_csv(self, csv_file, output_file=None, plot=True, fps=30, deception_threshold=0.5):
-        """Run the full prediction pipeline on a CSV file"""
-        # Preprocess data
-        X, timestamps, total_frames = self.preprocess_data(csv_file)
-        
-        # Make predictions
-        deception_score, binary_predictions, confidence = self.predict(X, deception_threshold)
+    def member_probabilities(self, X, batch_size=None):
+        """Raw probability of every ensemble member for every window, shape (windows, members)"""
+        raw_probabilities = np.zeros((len(X), len(self.models)))
+        for i, model in enumerate(self.models):
+            raw_probabilities[:, i] = model.predict(X, batch_size=batch_size, verbose=0).flatten()
+        return raw_probabilities
+    
+    def predict_cascade(self, X, deception_threshold=0.5, batch_size=None, verbose=True):
+        """Evaluate members in order, dropping windows whose decision can no longer change.
         
-        # Convert frames to seconds
-        timestamp_seconds = [t / fps for t in timestamps]
-        total_seconds = total_frames / fps
+        Returns the deception scores and the number of members evaluated for each window."""
+        n_models = len(self.models)
+        score_sum = np.zeros(len(X))
+        evaluated = np.zeros(len(X), dtype=int)
+        active = np.arange(len(X))
         
-        # Create results DataFrame
+        for i, model in enumerate(self.models):
+            if len(active) == 0:
+                break
+            score_sum[active] += model.predict(X[active], batch_size=batch_size, verbose=0).flatten()
+            evaluated[active] += 1
+            
+            # Member outputs lie in [0, 1], so the final mean is bounded by assuming the
+            # remaining members all output 0 or all output 1
+            remaining = n_models - (i + 1)
+            lower = score_sum[active] / n_models
+            upper = (score_sum[active] + remaining) / n_models
+            decided = (lower > deception_threshold) | (upper <= deception_threshold)
+            if self.cascade_confidence is not None:
+                partial_mean = score_sum[active] / evaluated[active]
+                decided |= 2 * np.abs(partial_mean - 0.5) >= self.cascade_confidence
+            active = active[~decided]
+        
+        if verbose:
+            saved = n_models * len(X) - int(evaluated.sum())
+            print(f"Cascade saved {saved} of {n_models * len(X)} member evaluations")
+        
+        # Windows that stopped early are scored with the mean of the members evaluated so far
+        return score_sum / evaluated, evaluated
+    
+    def cascade_savings(self, member_evaluations, windows):
+        """Member evaluations saved by cascade mode in an analysis that evaluated member_evaluations members for its scored windows"""
+        total = len(self.models) * windows
+        saved = total - member_evaluations
+        return {'saved_evaluations': saved, 'total_evaluations': total, 'saved_percent': saved / total * 100 if total else 0.0}
+    
+    def score_windows(self, X, face_coverage, deception_threshold=0.5, min_face_coverage=0.0, batch_size=None, verbose=True):
+        """Predict the windows that contain a subject; the others get no score.
+        
+        Also returns a dict of extra per-window result columns (cascade mode only)."""
+        has_subject = face_coverage >= min_face_coverage
+        if verbose:
+            print(f"Skipping {int((~has_subject).sum())} of {len(X)} chunks with face coverage below {min_face_coverage}")
+        
+        deception_score = np.full(len(X), np.nan)
+        binary_predictions = np.full(len(X), -1, dtype=int)
+        confidence = np.full(len(X), np.nan)
+        members_evaluated = np.zeros(len(X), dtype=int)
+        (deception_score[has_subject], binary_predictions[has_subject], confidence[has_subject],
+         members_evaluated[has_subject]) = self.predict_windows(X[has_subject], deception_threshold, batch_size, self.cascade, verbose)
+        
+        # Extra per-window columns for the results in cascade mode
+        details = {}
+        if self.cascade:
+            details['Members_Evaluated'] = members_evaluated
+            if self.cascade_audit:
+                # Exact scores for auditing the cascade decisions
+                exact_score = np.full(len(X), np.nan)
+                exact_score[has_subject] = self.predict_windows(X[has_subject], deception_threshold, batch_size, False, verbose)[0]
+                details['Exact_Deception_Score'] = exact_score
+        return deception_score, binary_predictions, confidence, has_subject, details
+    
+    def build_results(self, timestamps, total_frames, fps, deception_score, binary_predictions, confidence, face_coverage, has_subject, details=None, frame_offset=0):
+        """Create the chunk-wise results DataFrame; frame_offset shifts frames and times when only part of a video was analyzed"""
+        timestamps = [t + frame_offset for t in timestamps]
+        total_frames = total_frames + frame_offset
         results = pd.DataFrame({
             'Chunk_Start_Frame': [t - self.s_size // 2 for t in timestamps],
             'Chunk_End_Frame': [min(t + self.s_size // 2, total_frames) for t in timestamps],
             'Chunk_Start_Time': [(t - self.s_size // 2) / fps for t in timestamps],
             'Chunk_End_Time': [min(t + self.s_size // 2, total_frames) / fps for t in timestamps],
             'Frame': timestamps,
-            'Time_Seconds': timestamp_seconds,
+            'Time_Seconds': [t / fps for t in timestamps],
             'Deception_Score': deception_score,  # [0,1] scale
-            'Binary_Prediction': binary_predictions,  # 0: truth, 1: deception
-            'Confidence': confidence
+            'Binary_Prediction': binary_predictions,  # 0: truth, 1: deception, -1: no subject
+            'Confidence': confidence,
+            'Face_Coverage': face_coverage,
+            'Status': np.where(has_subject, 'scored', 'no subject')
         })
+        for column, values in (details or {}).items():
+            results[column] = values
+        return results
+    
+    def predict_from_csv(self, csv_file, output_file=None, plot=True, fps=30, deception_threshold=0.5, min_face_coverage=0.0, plot_file='deception_analysis.png', frame_offset=0):
+        """Run the full prediction pipeline on a CSV file. frame_offset is the video frame the first row belongs to"""
+        # Preprocess data
+        X, timestamps, total_frames, face_coverage = self.preprocess_data(csv_file)
+        
+        # Make predictions; only chunks with enough frames containing a face are scored
+        deception_score, binary_predictions, confidence, has_subject, details = self.score_windows(
+            X, face_coverage, deception_threshold, min_face_coverage
+        )
+        
+        total_seconds = total_frames / fps
+        
+        # Create results DataFrame
+        results = self.build_results(
+            timestamps, total_frames, fps, deception_score, binary_predictions, confidence, face_coverage, has_subject,
+            details, frame_offset
+        )
         
         # Save results if output file is specified
         if output_file:
@@ -158,97 +411,382 @@ class EnsemblePredictor:
         
         # Plot results if requested
         if plot:
-            self.plot_results(results, total_frames, total_seconds, fps, deception_threshold)
-        
-        # Store the total_frames for summary output
-        self.total_frames = total_frames
-        self.total_seconds = total_seconds
+            self.plot_results(results, total_frames, total_seconds, fps, deception_threshold, plot_file, frame_offset)
         
         return results
     
-    def plot_results(self, results, total_frames, total_seconds, fps=30, deception_threshold=0.5):
-        """Plot only the polygraph-style deception score graph"""
-        plt.figure(figsize=(15, 6), facecolor='#f9f9f9')
-        
-        # Set style
-        plt.style.use('seaborn-v0_8-whitegrid')
-        
-        # Plot deception score (polygraph style)
-        plt.plot(results['Time_Seconds'], results['Deception_Score'], color='#3366cc', linewidth=2.5)
-        plt.axhline(y=deception_threshold, color='#e74c3c', linestyle='--', alpha=0.6, linewidth=1.5)  # Reference line at threshold
-        
-        # Fill areas with more pleasing colors
-        plt.fill_between(results['Time_Seconds'], deception_threshold, results['Deception_Score'], 
-                         where=(results['Deception_Score'] > deception_threshold), color='#ff9999', alpha=0.4)
-        plt.fill_between(results['Time_Seconds'], deception_threshold, results['Deception_Score'], 
-                         where=(results['Deception_Score'] <= deception_threshold), color='#99cc99', alpha=0.4)
-        
-        # Adjust y-axis to show full [0,1] range with some padding
-        plt.ylim(-0.05, 1.05)  
-        plt.xlim(0, total_seconds)
-        
-        # Improve title and labels
-        plt.title('Deception Analysis', fontsize=16, fontweight='bold', pad=20)
-        plt.xlabel('Time (seconds)', fontsize=12, labelpad=10)
-        plt.ylabel('Deception Score', fontsize=12, labelpad=10)
+    def predict_from_csvs(self, csv_files, output_file=None, fps=30, deception_threshold=0.5, min_face_coverage=0.0, batch_windows=4096):
+        """Score many CSV files, batching windows from several files into each inference call"""
+        all_results = []
+        pending = []  # (source, X, timestamps, total_frames, face_coverage) waiting for inference
+        pending_windows = 0
+        
+        def flush():
+            # Run one inference call over all pending files and split the scores back per file
+            X = np.concatenate([item[1] for item in pending])
+            face_coverage = np.concatenate([item[4] for item in pending])
+            scores = self.score_windows(X, face_coverage, deception_threshold, min_face_coverage, batch_size=min(len(X), 1024))
+            offset = 0
+            for source, X_file, timestamps, total_frames, coverage in pending:
+                file_scores = [values[offset:offset + len(X_file)] for values in scores[:4]]
+                details = {column: values[offset:offset + len(X_file)] for column, values in scores[4].items()}
+                offset += len(X_file)
+                results = self.build_results(timestamps, total_frames, fps, *file_scores[:3], coverage, file_scores[3], details)
+                results.insert(0, 'Source', source)
+                all_results.append(results)
+            pending.clear()
+        
+        for i, csv_file in enumerate(csv_files):
+            try:
+                X, timestamps, total_frames, face_coverage = self.preprocess_data(csv_file, verbose=False)
+            except Exception as e:
+                print(f"Error reading {csv_file}: {e}")
+                continue
+            if len(X) == 0:
+                print(f"Skipping {csv_file}: no frames")
+                continue
+            pending.append((csv_file, X, timestamps, total_frames, face_coverage))
+            pending_windows += len(X)
+            if pending_windows >= batch_windows:
+                print(f"Scoring {pending_windows} windows from {len(pending)} files ({i + 1}/{len(csv_files)} read)")
+                flush()
+                pending_windows = 0
+        if pending:
+            print(f"Scoring {pending_windows} windows from {len(pending)} files")
+            flush()
+        
+        if not all_results:
+            raise ValueError("None of the input files could be processed")
+        results = pd.concat(all_results, ignore_index=True)
+        
+        # Parquet keeps the output compact and columnar; any other extension is written as CSV
+        if output_file:
+            if output_file.endswith('.parquet'):
+                results['Source'] = results['Source'].astype('category')
+                try:
+                    results.to_parquet(output_file, index=False)
+                except ImportError as e:
+                    # Keep the scored results rather than losing them to a missing parquet engine
+                    output_file = os.path.splitext(output_file)[0] + '.csv'
+                    print(f"Error: Cannot write parquet ({e}). Install pyarrow (pip install pyarrow); writing CSV to {output_file} instead")
+                    results.to_csv(output_file, index=False)
+            else:
+                results.to_csv(output_file, index=False)
+            print(f"Results for {results['Source'].nunique()} files saved to {output_file}")
         
-        # Customize grid
-        plt.grid(True, alpha=0.3, linestyle='--')
+        return results
+    
+    def predict_stream(self, frame_batches, output_file, plot=True, fps=30, deception_threshold=0.5, min_face_coverage=0.0,
+                       plot_file='deception_analysis.png', batch_windows=256, max_plot_points=2000):
+        """Score a stream of frame DataFrames with constant memory, appending results to output_file.
+        
+        Returns a dict of summary statistics (see ResultsSummary) instead of the full results DataFrame.
+        Batches are scored without the per-batch logging of the other modes, which would flood the log of a long recording."""
+        au_buffer = None  # Frames not yet forming a complete window
+        face_buffer = np.zeros(0)
+        windows, timestamps, coverage = [], [], []
+        total_frames = 0
+        header_written = False
+        plot_sampler = TimelineSampler(max_plot_points)
+        summary = ResultsSummary(deception_threshold)
+        
+        def flush(end_frame):
+            # Score the collected windows and append them to the results file
+            nonlocal header_written
+            X = np.array(windows)
+            face_coverage = np.array(coverage)
+            deception_score, binary_predictions, confidence, has_subject, details = self.score_windows(
+                X, face_coverage, deception_threshold, min_face_coverage, verbose=False
+            )
+            results = self.build_results(
+                timestamps, end_frame, fps, deception_score, binary_predictions, confidence, face_coverage, has_subject,
+                details
+            )
+            results.to_csv(output_file, mode='a' if header_written else 'w', header=not header_written, index=False)
+            header_written = True
+            
+            summary.add(results)
+            plot_sampler.add(results)
+            
+            windows.clear()
+            timestamps.clear()
+            coverage.clear()
+        
+        for batch in frame_batches:
+            au_columns = [col for col in batch.columns if col.startswith('AU')]
+            au_values = batch[au_columns].values
+            face_values = batch['face_present'].values if 'face_present' in batch.columns else np.ones(len(batch))
+            au_buffer = au_values if au_buffer is None else np.vstack((au_buffer, au_values))
+            face_buffer = np.concatenate((face_buffer, face_values))
+            
+            # Cut every complete window out of the buffer
+            while len(au_buffer) >= self.s_size:
+                windows.append(au_buffer[:self.s_size])
+                coverage.append(face_buffer[:self.s_size].mean())
+                timestamps.append(total_frames + self.s_size // 2)
+                total_frames += self.s_size
+                au_buffer = au_buffer[self.s_size:]
+                face_buffer = face_buffer[self.s_size:]
+            
+            if len(windows) >= batch_windows:
+                flush(total_frames)
         
-        # Add secondary x-axis for frame numbers
-        ax1 = plt.gca()
-        ax2 = ax1.twiny()
-        ax2.set_xlim(0, total_frames)
-        ax2.set_xlabel('Frame Number', fontsize=12, labelpad=10)
+        # Pad the remaining frames to a final window, as in preprocess_data
+        remainder = 0 if au_buffer is None else len(au_buffer)
+        if remainder > 0:
+            padding = np.zeros((self.s_size - remainder, au_buffer.shape[1]))
+            windows.append(np.vstack((au_buffer, padding)))
+            coverage.append(face_buffer.mean())
+            total_frames += remainder
+            timestamps.append(total_frames - remainder // 2)
+        if windows:
+            flush(total_frames)
+        if not header_written:
+            raise ValueError("No frames were received for prediction")
+        print(f"Results saved to {output_file}")
         
-        # Add legend for threshold
-        plt.legend(['Deception Score', f'Threshold ({deception_threshold})'], 
-                  loc='upper right', frameon=True, framealpha=0.9)
+        total_seconds = total_frames / fps
+        if plot:
+            self.plot_results(plot_sampler.to_frame(), total_frames, total_seconds, fps, deception_threshold, plot_file)
         
-        plt.tight_layout()
-        plt.savefig('deception_analysis.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("Analysis plot saved as 'deception_analysis.png'")
+        return summary.to_dict()
+    
+    def plot_results(self, results, total_frames, total_seconds, fps=30, deception_threshold=0.5, plot_file='deception_analysis.png', frame_offset=0):
+        """Plot only the polygraph-style deception score graph"""
+        with _plot_lock:
+            plt.figure(figsize=(15, 6), facecolor='#f9f9f9')
+        
+            # Set style
+            plt.style.use('seaborn-v0_8-whitegrid')
+        
+            # Plot deception score (polygraph style)
+            plt.plot(results['Time_Seconds'], results['Deception_Score'], color='#3366cc', linewidth=2.5)
+            plt.axhline(y=deception_threshold, color='#e74c3c', linestyle='--', alpha=0.6, linewidth=1.5)  # Reference line at threshold
+        
+            # Fill areas with more pleasing colors
+            plt.fill_between(results['Time_Seconds'], deception_threshold, results['Deception_Score'], 
+                             where=(results['Deception_Score'] > deception_threshold), color='#ff9999', alpha=0.4)
+            plt.fill_between(results['Time_Seconds'], deception_threshold, results['Deception_Score'], 
+                             where=(results['Deception_Score'] <= deception_threshold), color='#99cc99', alpha=0.4)
+        
+            # Grey out chunks that were skipped because no subject was visible
+            if 'Status' in results.columns:
+                for _, row in results[results['Status'] == 'no subject'].iterrows():
+                    plt.axvspan(row['Chunk_Start_Time'], row['Chunk_End_Time'], color='#cccccc', alpha=0.4, linewidth=0)
+        
+            # Adjust y-axis to show full [0,1] range with some padding
+            plt.ylim(-0.05, 1.05)  
+            plt.xlim(frame_offset / fps, frame_offset / fps + total_seconds)
+        
+            # Improve title and labels
+            plt.title('Deception Analysis', fontsize=16, fontweight='bold', pad=20)
+            plt.xlabel('Time (seconds)', fontsize=12, labelpad=10)
+            plt.ylabel('Deception Score', fontsize=12, labelpad=10)
+        
+            # Customize grid
+            plt.grid(True, alpha=0.3, linestyle='--')
+        
+            # Add secondary x-axis for frame numbers
+            ax1 = plt.gca()
+            ax2 = ax1.twiny()
+            ax2.set_xlim(frame_offset, frame_offset + total_frames)
+            ax2.set_xlabel('Frame Number', fontsize=12, labelpad=10)
+        
+            # Add legend for threshold
+            plt.legend(['Deception Score', f'Threshold ({deception_threshold})'], 
+                      loc='upper right', frameon=True, framealpha=0.9)
+        
+            plt.tight_layout()
+            plt.savefig(plot_file, dpi=300, bbox_inches='tight')
+            plt.close()
+            print(f"Analysis plot saved as '{plot_file}'")
+
+
+class ResultsSummary:
+    """Summary statistics of chunk-wise results, added a batch at a time so streaming analyses need not keep them.
+    
+    Every analysis mode reports this schema, so job summaries and batch summary columns do not depend on the mode.
+    Statistics of scored chunks are None when no chunk had a visible subject.
+    """
+    
+    def __init__(self, deception_threshold=0.5):
+        self.deception_threshold = deception_threshold
+        self.windows = 0
+        self.scored = 0
+        self.truthful = 0
+        self.deceptive = 0
+        self.score_sum = 0.0
+        self.confidence_sum = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.member_evaluations = None
+    
+    def add(self, results):
+        scored = results[results['Status'] == 'scored']
+        self.windows += len(results)
+        self.scored += len(scored)
+        self.truthful += int((scored['Deception_Score'] < self.deception_threshold).sum())
+        self.deceptive += int((scored['Deception_Score'] >= self.deception_threshold).sum())
+        self.score_sum += float(scored['Deception_Score'].sum())
+        self.confidence_sum += float(scored['Confidence'].sum())
+        if len(results):
+            # The padded last chunk overlaps the one before it, so the duration is the span of all chunks
+            start, end = float(results['Chunk_Start_Time'].min()), float(results['Chunk_End_Time'].max())
+            self.start_time = start if self.start_time is None else min(self.start_time, start)
+            self.end_time = end if self.end_time is None else max(self.end_time, end)
+        if 'Members_Evaluated' in results.columns:
+            self.member_evaluations = (self.member_evaluations or 0) + int(scored['Members_Evaluated'].sum())
+    
+    def to_dict(self):
+        def per_scored(value):
+            return value / self.scored if self.scored else None
+        
+        summary = {
+            'windows': self.windows,
+            'scored_windows': self.scored,
+            'duration_seconds': self.end_time - self.start_time if self.windows else 0.0,
+            'truthful_percent': per_scored(self.truthful * 100),
+            'deceptive_percent': per_scored(self.deceptive * 100),
+            'no_subject_percent': (self.windows - self.scored) / self.windows * 100 if self.windows else 0.0,
+            'average_score': per_scored(self.score_sum),
+            'average_confidence': per_scored(self.confidence_sum),
+        }
+        # Cascade mode only
+        if self.member_evaluations is not None:
+            summary['average_members_evaluated'] = per_scored(self.member_evaluations)
+        return summary
+
+
+def summarize_results(results, deception_threshold=0.5):
+    """Summary statistics of a chunk-wise results DataFrame (streaming mode already returns a summary dict)"""
+    if isinstance(results, dict):
+        return results
+    summary = ResultsSummary(deception_threshold)
+    summary.add(results)
+    return summary.to_dict()
+
+
+class TimelineSampler:
+    """Keeps a bounded, evenly strided sample of result rows for plotting long recordings"""
+    
+    def __init__(self, max_points=2000):
+        self.max_points = max_points
+        self.stride = 1
+        self.seen = 0
+        self.rows = []
+    
+    def add(self, results):
+        for row in results.to_dict(orient='records'):
+            if self.seen % self.stride == 0:
+                self.rows.append(row)
+            self.seen += 1
+            # Halve the sample and double the stride whenever it grows past the limit
+            if len(self.rows) > self.max_points:
+                self.rows = self.rows[::2]
+                self.stride *= 2
+    
+    def to_frame(self):
+        return pd.DataFrame(self.rows)
 
 
 if __name__ == "__main__":
     import argparse
     
+    import glob
+    
     parser = argparse.ArgumentParser(description="Run deception detection on action unit data")
-    parser.add_argument("input_csv", help="Path to the CSV file with action unit data")
-    parser.add_argument("--output", "-o", help="Path to save prediction results CSV")
+    parser.add_argument("inputs", nargs="+", help="CSV files with action unit data, glob patterns, or @list.txt files listing one CSV per line")
+    parser.add_argument("--output", "-o", help="Path to save prediction results (.csv, or .parquet for a compact columnar file)")
     parser.add_argument("--no-plot", action="store_true", help="Disable plotting")
     parser.add_argument("--fps", type=float, default=30.0, help="Frames per second of the original video (default: 30)")
     parser.add_argument("--threshold", "-t", type=float, default=0.5, help="Threshold for deception classification (default: 0.5)")
+    parser.add_argument("--min-face-coverage", type=float, default=0.0, help="Minimum fraction of frames with a detected face for a chunk to be scored (default: 0.0)")
+    parser.add_argument("--batch-windows", type=int, default=4096, help="Number of windows collected from several files per inference call (default: 4096)")
+    parser.add_argument("--cascade", action="store_true", help="Stop evaluating ensemble members for a chunk once its classification cannot change")
+    parser.add_argument("--cascade-confidence", type=float, help="In cascade mode, also stop once the partial score reaches this confidence (0 to 1)")
+    parser.add_argument("--audit", action="store_true", help="In cascade mode, also compute exact scores into an Exact_Deception_Score column")
+    parser.add_argument("--precision", choices=["float32", "float16", "int8"], default="float32", help="Model precision; reduced precisions must be created with ModelConverter first (default: float32)")
     
     args = parser.parse_args()
     
-    predictor = EnsemblePredictor()
-    results = predictor.predict_from_csv(
-        args.input_csv, 
-        output_file=args.output,
-        plot=not args.no_plot,
-        fps=args.fps,
-        deception_threshold=args.threshold
+    # Expand glob patterns and list files into individual CSV paths
+    input_csvs = []
+    for item in args.inputs:
+        if item.startswith("@"):
+            with open(item[1:]) as f:
+                input_csvs.extend(line.strip() for line in f if line.strip())
+        elif glob.has_magic(item):
+            input_csvs.extend(sorted(glob.glob(item)))
+        else:
+            input_csvs.append(item)
+    if not input_csvs:
+        parser.error("No input CSV files found")
+    
+    # The ensemble is loaded once for all inputs
+    predictor = EnsemblePredictor(
+        precision=args.precision,
+        cascade=args.cascade,
+        cascade_confidence=args.cascade_confidence,
+        cascade_audit=args.audit
     )
     
-    # Calculate percentages of time spent in each category based on deception score
-    truthful_percent = (results['Deception_Score'] < args.threshold).mean() * 100
-    deceptive_percent = (results['Deception_Score'] >= args.threshold).mean() * 100
-    
-    # Also calculate statistics based on traditional binary predictions
-    binary_truth_percent = (results['Binary_Prediction'] == 0).mean() * 100
-    binary_deception_percent = (results['Binary_Prediction'] == 1).mean() * 100
-    
-    print("\n=== Analysis Summary ===")
-    print(f"Total frames analyzed: {len(results['Deception_Score']) * predictor.s_size}")
-    print(f"Total video duration: {predictor.total_seconds:.2f} seconds")
-    print(f"\nUsing threshold: {args.threshold}")
-    print(f"Based on Continuous Deception Score [0 to 1]:")
-    print(f"Truthful periods (score < {args.threshold}): {truthful_percent:.1f}% of frames")
-    print(f"Deceptive periods (score >= {args.threshold}): {deceptive_percent:.1f}% of frames")
-    print(f"Average deception score: {results['Deception_Score'].mean():.2f}")
-    print("\nBased on Binary Classification:")
-    print(f"Truth classification: {binary_truth_percent:.1f}% of frames")
-    print(f"Deception classification: {binary_deception_percent:.1f}% of frames")
-    print(f"Average confidence: {results['Confidence'].mean():.2f}") 
\ No newline at end of file
+    if len(input_csvs) > 1:
+        results = predictor.predict_from_csvs(
+            input_csvs,
+            output_file=args.output or "batch_predictions.csv",
+            fps=args.fps,
+            deception_threshold=args.threshold,
+            min_face_coverage=args.min_face_coverage,
+            batch_windows=args.batch_windows
+        )
+        
+        # One summary line per source file
+        scored = results[results['Status'] == 'scored']
+        summary = scored.groupby('Source', observed=True)['Deception_Score'].agg(['count', 'mean'])
+        summary['deceptive_percent'] = scored.groupby('Source', observed=True)['Deception_Score'].apply(
+            lambda scores: (scores >= args.threshold).mean() * 100
+        )
+        print("\n=== Analysis Summary ===")
+        print(summary.rename(columns={'count': 'scored_chunks', 'mean': 'average_score'}).to_string(float_format='%.2f'))
+    else:
+        results = predictor.predict_from_csv(
+            input_csvs[0], 
+            output_file=args.output,
+            plot=not args.no_plot,
+            fps=args.fps,
+            deception_threshold=args.threshold,
+            min_face_coverage=args.min_face_coverage
+        )
+    
+        total_seconds = results['Chunk_End_Time'].max() if len(results) else 0.0
+        
+        # Statistics only cover chunks where a subject was visible
+        no_subject_percent = (results['Status'] == 'no subject').mean() * 100
+        results = results[results['Status'] == 'scored']
+    
+        # Calculate percentages of time spent in each category based on deception score
+        truthful_percent = (results['Deception_Score'] < args.threshold).mean() * 100
+        deceptive_percent = (results['Deception_Score'] >= args.threshold).mean() * 100
+    
+        # Also calculate statistics based on traditional binary predictions
+        binary_truth_percent = (results['Binary_Prediction'] == 0).mean() * 100
+        binary_deception_percent = (results['Binary_Prediction'] == 1).mean() * 100
+    
+        print("\n=== Analysis Summary ===")
+        print(f"Total frames analyzed: {len(results['Deception_Score']) * predictor.s_size}")
+        print(f"Total video duration: {total_seconds:.2f} seconds")
+        print(f"No subject visible: {no_subject_percent:.1f}% of chunks")
+        print(f"\nUsing threshold: {args.threshold}")
+        print(f"Based on Continuous Deception Score [0 to 1]:")
+        print(f"Truthful periods (score < {args.threshold}): {truthful_percent:.1f}% of frames")
+        print(f"Deceptive periods (score >= {args.threshold}): {deceptive_percent:.1f}% of frames")
+        print(f"Average deception score: {results['Deception_Score'].mean():.2f}")
+        print("\nBased on Binary Classification:")
+        print(f"Truth classification: {binary_truth_percent:.1f}% of frames")
+        print(f"Deception classification: {binary_deception_percent:.1f}% of frames")
+        print(f"Average confidence: {results['Confidence'].mean():.2f}")
+    
+    if args.cascade:
+        scored = results[results['Status'] == 'scored']
+        savings = predictor.cascade_savings(int(scored['Members_Evaluated'].sum()), len(scored))
+        print(f"\nCascade saved {savings['saved_evaluations']} of {savings['total_evaluations']} member evaluations ({savings['saved_percent']:.1f}%)") 
\ No newline at end of file
@@ -3,41 +3,156 @@ import torch
 import os
 import subprocess
 import shutil
+import math
+from Model.Profiler import profiled
 
 # Check if GPU is available
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# Function to extract frame chunks, feed to AU generator, and clear memory
-def extract_and_process_chunks(video_path, chunk_size, temp_img_folder, openface_executable, output_folder):
+# Yield (frame_index, frame) pairs from a video file, numbering frames from start
+def iter_video_frames(cap, start=0):
+    frame_index = start
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame_index, frame
+        frame_index += 1
+
+# Index of the first output frame the source frame at source_index maps to after resampling.
+# Output frame k takes the source frame floor(k * source_fps / target_fps).
+def resample_start(source_index, source_fps, target_fps):
+    return math.ceil(source_index * target_fps / source_fps - 1e-9)
+
+# Number of output frames the source frame at source_index maps to after resampling, so a
+# source frame is dropped (0) when decimating and repeated (>1) when upsampling.
+def resample_count(source_index, source_fps, target_fps):
+    first = resample_start(source_index, source_fps, target_fps)
+    last = resample_start(source_index + 1, source_fps, target_fps)
+    return max(0, last - first)
+
+# Resample a stream of (frame_index, frame) pairs from source_fps to target_fps.
+# Output indices are global, so a stream starting mid-video is numbered as if decoded from the start.
+def resample_frames(frames, source_fps, target_fps):
+    for source_index, frame in frames:
+        first = resample_start(source_index, source_fps, target_fps)
+        for output_index in range(first, first + resample_count(source_index, source_fps, target_fps)):
+            yield output_index, frame
+
+# Position cap at source frame frame_index, returning the capture to read from. If the container
+# does not support exact seeking, the video is reopened and decoded up to the frame instead.
+def seek_to_frame(cap, video_path, frame_index):
+    if frame_index <= 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    if position != frame_index:
+        cap.release()
+        cap = cv2.VideoCapture(video_path)
+        position = 0
+    while position < frame_index and cap.grab():
+        position += 1
+    return cap
+
+# Decode a video into chunks of chunk_size frames, yielding (chunk_index, frames).
+# If target_fps is given, frames are resampled to that rate before extraction so
+# that every chunk of chunk_size frames covers the same duration the model was trained on.
+# If frame_transform is given (e.g. a FaceCropper), it is applied to every frame before extraction.
+# If allocation is given (a JobAllocation from the resource scheduler), the number of decode workers is
+# limited to the cores assigned to the decode stage of this job. OpenCV's own thread pool is process-wide,
+# so the scheduler sizes it for all the jobs of the process.
+# With decode_workers > 1 the video is decoded as segments in that many worker processes (capped by
+# the decode cores of the allocation), which also resample and transform their frames.
+# start_chunk and end_chunk limit decoding to chunks [start_chunk, end_chunk) of the whole video: the
+# video is seeked to the first one and chunk indices stay those of a full decode.
+def iter_frame_chunks(video_path, chunk_size, target_fps=None, frame_transform=None, allocation=None, decode_workers=1, start_chunk=0, end_chunk=None):
     cap = cv2.VideoCapture(video_path)
     frames = []
-    chunk_index = 0  # Initialize chunk index for naming CSV files
+    chunk_index = start_chunk  # Initialize chunk index for naming CSV files
     
     if not cap.isOpened():
         print(f"Error opening video file {video_path}")
         return
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    source_fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if allocation is not None:
+        decode_workers = min(decode_workers, max(1, allocation.threads("decode")))
+
+    # Output frames to produce, and the source frames they come from
+    first_frame = start_chunk * chunk_size
+    last_frame = end_chunk * chunk_size if end_chunk is not None else None
+    resampling = bool(target_fps) and source_fps > 0
+    to_source = (lambda index: int(index * source_fps / target_fps)) if resampling else (lambda index: index)
+    # One frame of margin on each side guards against rounding; the extra output frames are skipped below
+    source_start = max(0, to_source(first_frame) - 1)
+    source_end = to_source(last_frame) + 2 if last_frame is not None else None
+
+    if decode_workers > 1 and source_fps > 0 and total_frames > 0:
+        # Imported here to avoid a circular import; ParallelDecoder uses the resampling functions above
+        from Model.PreProcessing.ParallelDecoder import iter_frames_parallel
+        if target_fps:
+            print(f"Resampling video from {source_fps:.2f} FPS to {target_fps} FPS")
+        frame_source = (
+            (index, frame) for index, _, frame in
+            iter_frames_parallel(
+                video_path, source_fps, total_frames, target_fps, frame_transform, decode_workers,
+                start_frame=source_start, end_frame=source_end
+            )
+        )
+        frame_transform = None  # Already applied by the decode workers
+    elif resampling:
+        print(f"Resampling video from {source_fps:.2f} FPS to {target_fps} FPS")
+        cap = seek_to_frame(cap, video_path, source_start)
+        frame_source = resample_frames(iter_video_frames(cap, source_start), source_fps, target_fps)
+    else:
+        cap = seek_to_frame(cap, video_path, source_start)
+        frame_source = iter_video_frames(cap, source_start)
+        if target_fps:
+            print(f"Warning: Could not read frame rate of {video_path}, skipping resampling")
+
+    try:
+        for frame_index, frame in frame_source:
+            # Frames before the start can come from the source frame the seek landed on
+            if frame_index < first_frame:
+                continue
+            if last_frame is not None and frame_index >= last_frame:
+                break
+            if frame_transform is not None:
+                frame = frame_transform(frame)
+
+            # Convert frame to a torch tensor and move to GPU
+            frame_tensor = torch.tensor(frame).to(device)
+            frames.append(frame_tensor)
 
-        # Convert frame to a torch tensor and move to GPU
-        frame_tensor = torch.tensor(frame).to(device)
-        frames.append(frame_tensor)
+            # If we have collected a full chunk of frames, hand it over
+            if len(frames) == chunk_size:
+                yield chunk_index, frames
+                frames = []  # Clear frames list for the next chunk
+                chunk_index += 1
+    finally:
+        # Also shuts down the decode workers if the caller stopped early
+        frame_source.close()
+        cap.release()
 
-        # If we have collected a full chunk of frames, process it
-        if len(frames) == chunk_size:
-            # Process the chunk for AU extraction and save each result in a single CSV with a unique name
-            csv_filename = f"{os.path.basename(video_path)}_chunk_{chunk_index}.csv"
-            process_chunk_for_AUs(frames, temp_img_folder, openface_executable, output_folder, csv_filename)
-            frames = []  # Clear frames list for the next chunk
-            chunk_index += 1
+# Name of the AU CSV file written for a chunk
+def chunk_csv_filename(video_path, chunk_index):
+    return f"{os.path.basename(video_path)}_chunk_{chunk_index}.csv"
 
-    cap.release()
+# Function to extract frame chunks, feed to AU generator, and clear memory.
+# See iter_frame_chunks for target_fps, frame_transform, allocation and decode_workers; OpenFace is also
+# limited to the cores assigned to the extract stage.
+@profiled("extract_and_process_chunks")
+def extract_and_process_chunks(video_path, chunk_size, temp_img_folder, openface_executable, output_folder, target_fps=None, frame_transform=None, allocation=None, decode_workers=1, extraction_flags=None):
+    for chunk_index, frames in iter_frame_chunks(video_path, chunk_size, target_fps, frame_transform, allocation, decode_workers):
+        # Process the chunk for AU extraction and save each result in a single CSV with a unique name
+        csv_filename = chunk_csv_filename(video_path, chunk_index)
+        cpu_cores = allocation.cores("extract") if allocation is not None else None
+        process_chunk_for_AUs(frames, temp_img_folder, openface_executable, output_folder, csv_filename, cpu_cores, extraction_flags)
 
 # Function to convert frames to images and run AU extraction
-def process_chunk_for_AUs(frames, temp_img_folder, openface_executable, output_folder, csv_filename):
+# extraction_flags selects OpenFace's output groups (e.g. ["-aus"]); None computes and writes all of them
+def process_chunk_for_AUs(frames, temp_img_folder, openface_executable, output_folder, csv_filename, cpu_cores=None, extraction_flags=None):
     # Ensure the temporary image folder exists
     os.makedirs(temp_img_folder, exist_ok=True)
     
@@ -57,9 +172,29 @@ def process_chunk_for_AUs(frames, temp_img_folder, openface_executable, output_f
     # Using a different approach to avoid nested directory creation
     # We provide the full output_dir but specify only the filename for -of parameter
     openface_command = f"\"{os.path.abspath(openface_executable)}\" -fdir \"{os.path.abspath(temp_img_folder)}\" -out_dir \"{os.path.abspath(output_folder)}\" -of \"{csv_filename}\""
+    if extraction_flags:
+        openface_command += " " + " ".join(extraction_flags)
     
     print(f"Running command: {openface_command}")
-    subprocess.call(openface_command, shell=True)
+    if cpu_cores:
+        # Limit OpenFace's thread pools to its cores, and pin it to them where the OS supports it
+        env = os.environ.copy()
+        for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            env[name] = str(len(cpu_cores))
+        # preexec_fn is unsafe while other threads run (stages of the pipeline), so pin with taskset, or
+        # pin the process right after it starts; its threads are created later and inherit the affinity
+        taskset = shutil.which("taskset") if hasattr(os, "sched_setaffinity") else None
+        if taskset:
+            openface_command = f"\"{taskset}\" -c {','.join(str(core) for core in cpu_cores)} {openface_command}"
+        process = subprocess.Popen(openface_command, shell=True, env=env)
+        if not taskset and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(process.pid, cpu_cores)
+            except OSError:
+                pass  # The process already exited
+        process.wait()
+    else:
+        subprocess.call(openface_command, shell=True)
     
     # After OpenFace runs, check if the file was created with the expected path
     # If not, it might have been created in a subdirectory, so try to find and move it
@@ -0,0 +1,86 @@
+import os
+import pickle
+import re
+
+# The exact 32 AUs the ensemble was trained on, used when the model metadata does not list its feature columns
+TRAINING_AU_COLUMNS = [
+    'AU02_r', 'AU04_r', 'AU05_r', 'AU06_r', 'AU07_r', 'AU09_r',
+    'AU10_r', 'AU12_r', 'AU14_r', 'AU15_r', 'AU17_r', 'AU20_r', 'AU25_r', 'AU26_r',
+    'AU45_r', 'AU01_c', 'AU02_c', 'AU04_c', 'AU05_c', 'AU06_c', 'AU07_c', 'AU09_c',
+    'AU10_c', 'AU12_c', 'AU14_c', 'AU15_c', 'AU20_c', 'AU23_c', 'AU25_c', 'AU26_c',
+    'AU28_c', 'AU45_c'
+]
+
+# Columns OpenFace writes whatever outputs are selected; success and confidence gate the windows
+TRACKING_COLUMNS = ['success', 'confidence']
+
+# OpenFace FeatureExtraction output groups and the columns each one writes
+FEATURE_GROUPS = [
+    ('-aus', re.compile(r'^AU\d+_[rc]$')),
+    ('-pose', re.compile(r'^pose_(T|R)[xyz]$')),
+    ('-gaze', re.compile(r'^gaze_')),
+    ('-2Dfp', re.compile(r'^(eye_lmk_)?[xy]_\d+$')),
+    ('-3Dfp', re.compile(r'^(eye_lmk_)?[XYZ]_\d+$')),
+    ('-pdmparams', re.compile(r'^p_')),
+]
+
+
+class ExtractionProfile:
+    """OpenFace outputs needed for a set of model feature columns.
+
+    Selecting output groups makes OpenFace skip computing and writing the others (gaze, landmarks,
+    head pose, shape parameters), which makes extraction faster and the CSV files much smaller.
+    The 'full' profile passes no selection, so OpenFace writes everything as before.
+    """
+
+    def __init__(self, feature_columns=None, full=False):
+        self.feature_columns = list(feature_columns or TRAINING_AU_COLUMNS)
+        self.full = full
+        self.flags = []
+        self.reported_missing = set()
+        if not full:
+            for flag, pattern in FEATURE_GROUPS:
+                if any(pattern.match(column) for column in self.feature_columns):
+                    self.flags.append(flag)
+            unknown = [column for column in self.feature_columns if not any(pattern.match(column) for _, pattern in FEATURE_GROUPS)]
+            if unknown:
+                raise ValueError(f"No OpenFace output group produces the feature columns {unknown}")
+
+    @classmethod
+    def from_metadata(cls, metadata_path='Model/Models/ensemble_metadata.pkl', full=False):
+        """Profile for the ensemble's features: metadata['feature_columns'] if present, else the training AUs"""
+        if not os.path.exists(metadata_path):
+            print(f"Warning: No ensemble metadata at {metadata_path}, extracting the training AUs")
+            return cls(full=full)
+        with open(metadata_path, 'rb') as f:
+            metadata = pickle.load(f)
+        feature_columns = metadata.get('feature_columns', TRAINING_AU_COLUMNS)
+        input_shape = metadata.get('input_shape')
+        if input_shape is not None and input_shape[-1] != len(feature_columns):
+            raise ValueError(f"The model expects {input_shape[-1]} features but the profile has {len(feature_columns)} columns")
+        return cls(feature_columns, full=full)
+
+    @property
+    def output_columns(self):
+        """Columns every extracted CSV must contain"""
+        return self.feature_columns + TRACKING_COLUMNS
+
+    def validate(self, columns, source=""):
+        """Warn about required columns an extracted CSV lacks; the AU cleaning step fills them with zeros.
+
+        Returns the missing columns. Each missing column is only reported once per profile.
+        """
+        missing = [column for column in self.output_columns if column not in set(columns)]
+        new = [column for column in missing if column not in self.reported_missing]
+        if new:
+            self.reported_missing.update(new)
+            print(
+                f"Warning: Extracted Action Units{' in ' + source if source else ''} are missing {new}; missing AUs are filled with zeros. "
+                f"Check that OpenFace supports the output flags {self.flags}, or set OPENFACE_EXTRACTION_PROFILE=full"
+            )
+        return missing
+
+    def describe(self):
+        if self.full:
+            return "full (all OpenFace outputs)"
+        return f"{' '.join(self.flags)} ({len(self.feature_columns)} feature columns)"
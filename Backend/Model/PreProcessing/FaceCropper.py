@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+
+
+# Crops every frame to a square region around the subject's face and downsizes it to a
+# bounded resolution, so that OpenFace and the image writes only handle the pixels it needs.
+class FaceCropper:
+    def __init__(self, max_size=480, margin=0.6, redetect_interval=30, detection_width=640, fallback_size=960):
+        self.max_size = max_size  # Upper bound on the side length of the cropped output frames
+        self.margin = margin  # Extra space around the face, as a fraction of the face size on each side
+        self.redetect_interval = redetect_interval  # Re-run face detection every N frames to follow the subject
+        self.detection_width = detection_width  # Frames are downscaled to this width for detection
+        self.fallback_size = fallback_size  # Longest side of frames passed through before a face is found
+
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.center = None
+        self.side = None
+        self.output_size = None
+        self.frame_count = 0
+        self.tracking = True  # Re-detect and follow the face; turned off by lock_region
+
+    def __getstate__(self):
+        # The cascade classifier cannot be pickled; it is reloaded when a copy is sent to a decode worker
+        state = self.__dict__.copy()
+        del state["face_cascade"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect_face(self, frame):
+        """Return (center_x, center_y, size) of the largest face in the frame, or None"""
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.detection_width / width)
+        small = cv2.resize(frame, (int(width * scale), int(height * scale))) if scale < 1.0 else frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        faces = self.face_cascade.detectMultiScale(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(30, 30)
+        )
+        if len(faces) == 0:
+            return None
+
+        # Track the largest face, which is assumed to be the subject
+        x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+        return (x + w / 2) / scale, (y + h / 2) / scale, max(w, h) / scale
+
+    def lock_region(self, frames):
+        """Fix the crop region from frames sampled over the whole video and stop tracking.
+
+        Copies of a locked cropper used on different segments all crop the same region at the same size.
+        """
+        faces = [face for face in (self.detect_face(frame) for frame in frames) if face is not None]
+        self.tracking = False
+        if not faces:
+            print("No face found in the sampled frames, passing whole frames through")
+            return
+        # The median position is robust to false detections; the largest face keeps the subject inside the crop
+        self.center = (float(np.median([face[0] for face in faces])), float(np.median([face[1] for face in faces])))
+        self.side = max(face[2] for face in faces) * (1 + 2 * self.margin)
+        self.output_size = int(min(self.max_size, self.side))
+        print(f"Face found at ({self.center[0]:.0f}, {self.center[1]:.0f}) in {len(faces)} of {len(frames)} sampled frames, "
+              f"cropping to a {self.side:.0f}px region")
+
+    def output_shape(self, width, height):
+        """(width, height) of the frames returned for frames of the given size, with the current region"""
+        if self.center is None:
+            scale = min(1.0, self.fallback_size / max(height, width))
+            return (int(width * scale), int(height * scale)) if scale < 1.0 else (width, height)
+        return self.output_size, self.output_size
+
+    def __call__(self, frame):
+        """Crop and resize a single BGR frame"""
+        if self.tracking and self.frame_count % self.redetect_interval == 0:
+            face = self.detect_face(frame)
+            if face is not None:
+                center_x, center_y, size = face
+                side = size * (1 + 2 * self.margin)
+                if self.center is None:
+                    print(f"Face found at ({center_x:.0f}, {center_y:.0f}), cropping to a {side:.0f}px region")
+                    self.center = (center_x, center_y)
+                    self.side = side
+                    # Never upscale small faces; the output size is fixed from here on
+                    self.output_size = int(min(self.max_size, side))
+                else:
+                    # Smooth the region so the crop does not jump between detections
+                    self.center = (0.5 * self.center[0] + 0.5 * center_x, 0.5 * self.center[1] + 0.5 * center_y)
+                    self.side = 0.8 * self.side + 0.2 * side
+        self.frame_count += 1
+
+        height, width = frame.shape[:2]
+
+        # Until a face is found pass the whole frame through, downscaled to a bounded size
+        if self.center is None:
+            scale = min(1.0, self.fallback_size / max(height, width))
+            if scale < 1.0:
+                return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+            return frame
+
+        # Square crop around the face, shifted to stay inside the frame
+        side = int(min(self.side, height, width))
+        left = int(min(max(self.center[0] - side / 2, 0), width - side))
+        top = int(min(max(self.center[1] - side / 2, 0), height - side))
+        crop = frame[top:top + side, left:left + side]
+
+        # Always output the same size so OpenFace sees a consistent image sequence
+        return cv2.resize(crop, (self.output_size, self.output_size), interpolation=cv2.INTER_AREA)
+
@@ -0,0 +1,172 @@
+import math
+import multiprocessing
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from Model.PreProcessing.AUsGenerator import resample_start, resample_count, seek_to_frame
+
+# Upper bound on the decoded frames one segment holds; at most workers + 1 segments are in memory at once
+SEGMENT_MEMORY_MB = 64
+
+
+# Frame indices of the video's keyframes, read from the packet flags with ffprobe so nothing is decoded.
+# Returns None if ffprobe is not installed or the keyframes cannot be read.
+def probe_keyframes(video_path, fps):
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None or fps <= 0:
+        return None
+
+    command = [
+        ffprobe, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=120, check=True).stdout
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: Could not read keyframes of {video_path}: {e}")
+        return None
+
+    packet_times = []
+    keyframe_times = []
+    for line in output.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 2 or fields[0] in ("", "N/A"):
+            continue
+        packet_times.append(float(fields[0]))
+        if "K" in fields[1]:
+            keyframe_times.append(float(fields[0]))
+    if not keyframe_times:
+        return None
+
+    # Timestamps count from the first presented frame
+    first = min(packet_times)
+    return sorted({round((t - first) * fps) for t in keyframe_times})
+
+
+# Split source frames [start_frame, end_frame) into about segment_count segments of equal length.
+# With keyframes, every boundary is moved to the nearest keyframe so each worker's seek is cheap, unless
+# that keyframe is more than snap_distance frames away (which would make the segment too long).
+# Returns (start, end) source frame ranges; without end_frame the last segment has end None and runs
+# to the end of the file, since the frame count reported by the container can be off.
+def plan_segments(total_frames, segment_count, keyframes=None, start_frame=0, end_frame=None, snap_distance=None):
+    stop = end_frame if end_frame is not None else total_frames
+    bounds = [start_frame]
+    for k in range(1, segment_count):
+        boundary = start_frame + (stop - start_frame) * k // segment_count
+        if keyframes:
+            keyframe = min(keyframes, key=lambda keyframe: abs(keyframe - boundary))
+            if snap_distance is None or abs(keyframe - boundary) <= snap_distance:
+                boundary = keyframe
+        if bounds[-1] < boundary < stop:
+            bounds.append(boundary)
+    return list(zip(bounds, bounds[1:] + [end_frame]))
+
+
+# count frames spread evenly over source frames [start_frame, end_frame), e.g. to locate the face
+def sample_frames(video_path, start_frame, end_frame, count=16):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frames = []
+        for k in range(count):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame + (end_frame - start_frame) * k // count)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        return frames
+    finally:
+        cap.release()
+
+
+# Decode source frames [start, end) in a worker process and return (frame_index, timestamp, frame) for
+# every output frame, with global indices after resampling to target_fps. frame_transform is applied in
+# the worker, so only cropped and downscaled frames are sent back.
+def decode_segment(video_path, start, end, source_fps, target_fps=None, frame_transform=None):
+    cv2.setNumThreads(1)  # Parallelism comes from the worker processes
+    cap = cv2.VideoCapture(video_path)
+    try:
+        cap = seek_to_frame(cap, video_path, start)
+        frames = []
+        source_index = start
+        while end is None or source_index < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if target_fps:
+                first = resample_start(source_index, source_fps, target_fps)
+                count = resample_count(source_index, source_fps, target_fps)
+            else:
+                first, count = source_index, 1
+            if count:
+                if frame_transform is not None:
+                    frame = frame_transform(frame)
+                fps = target_fps or source_fps
+                frames.extend((index, index / fps, frame) for index in range(first, first + count))
+            source_index += 1
+        return frames
+    finally:
+        cap.release()
+
+
+# Yield (frame_index, timestamp, frame) in order for source frames [start_frame, end_frame) (by default
+# the whole video), decoding them as segments in worker processes. Segments are sized so the frames
+# each one returns (after frame_transform) fit in segment_memory_mb, and at most `workers` segments are
+# in flight, which bounds the decoded frames held in memory; the caller works on one segment while the
+# workers decode the next ones.
+# A frame_transform with lock_region (a FaceCropper) has its crop region fixed before decoding, so
+# every segment crops the same region at the same size.
+def iter_frames_parallel(video_path, source_fps, total_frames, target_fps=None, frame_transform=None, workers=4,
+                         segment_memory_mb=SEGMENT_MEMORY_MB, start_frame=0, end_frame=None):
+    stop = end_frame if end_frame is not None else total_frames
+    if hasattr(frame_transform, "lock_region"):
+        frame_transform.lock_region(sample_frames(video_path, start_frame, stop))
+
+    cap = cv2.VideoCapture(video_path)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    if hasattr(frame_transform, "output_shape"):
+        width, height = frame_transform.output_shape(width, height)
+    output_frames = max(1, segment_memory_mb * 1024 * 1024 // max(1, width * height * 3))
+    # Resampling changes how many output frames each source frame yields
+    segment_frames = max(1, int(output_frames * source_fps / target_fps) if target_fps else output_frames)
+
+    segment_count = max(workers, math.ceil((stop - start_frame) / segment_frames))
+    keyframes = probe_keyframes(video_path, source_fps)
+    segments = plan_segments(total_frames, segment_count, keyframes, start_frame, end_frame, snap_distance=segment_frames // 2)
+    alignment = "keyframe-aligned" if keyframes else "equal"
+    print(f"Decoding {video_path} as {len(segments)} {alignment} segments of about {segment_frames} frames ({width}x{height} output) "
+          f"with {workers} worker processes")
+
+    expected = None
+    pending = deque()
+    next_segment = 0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        def submit_segments():
+            nonlocal next_segment
+            while next_segment < len(segments) and len(pending) < workers:
+                start, end = segments[next_segment]
+                pending.append(executor.submit(decode_segment, video_path, start, end, source_fps, target_fps, frame_transform))
+                next_segment += 1
+
+        try:
+            submit_segments()
+            while pending:
+                frames = pending.popleft().result()
+                submit_segments()
+                for index, timestamp, frame in frames:
+                    # Guard against inexact seeks at segment boundaries
+                    if expected is None:
+                        expected = index
+                    if index < expected:
+                        continue
+                    if index > expected:
+                        print(f"Warning: Frames {expected} to {index - 1} are missing after a segment boundary")
+                    yield index, timestamp, frame
+                    expected = index + 1
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,166 @@
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# The profiler of the analysis running in the current context, if any. Each analysis (a /report request in the
+# threadpool, a worker job) sets its own, so concurrent analyses are profiled separately.
+_current = contextvars.ContextVar("profiler", default=None)
+
+
+def should_profile(requested=False):
+    """Profile when asked to, or for PROFILE_SAMPLE_PERCENT percent of analyses"""
+    if requested:
+        return True
+    percent = float(os.getenv("PROFILE_SAMPLE_PERCENT") or 0)
+    return random.uniform(0, 100) < percent
+
+
+class Profiler:
+    """Sampled stack profile and wall-clock spans of one analysis.
+
+    While running, a background thread records the Python stack of the thread that started the
+    profiler and of the threads the analysis starts through in_analysis (e.g. pipeline stages)
+    every interval seconds. Threads of other analyses, including other profiled ones, are left out.
+    Samples are wall-clock, so time spent waiting on OpenFace or TensorFlow shows up under the call
+    that waits. Stacks are saved in the folded format read by flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.spans = []
+        self.samples = 0
+        self.started = None
+        self.threads = set()
+        self.token = None
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start profiling the analysis running in the calling thread"""
+        self.token = _current.set(self)
+        self.add_thread()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling; call from the thread that started the profiler. Stopping again does nothing."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.token is not None:
+            _current.reset(self.token)
+            self.token = None
+
+    def add_thread(self):
+        with self.lock:
+            self.threads.add(threading.get_ident())
+
+    def remove_thread(self):
+        with self.lock:
+            self.threads.discard(threading.get_ident())
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                threads = set(self.threads)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def record_span(self, name, start, end):
+        with self.lock:
+            self.spans.append({
+                "name": name,
+                "thread": threading.current_thread().name,
+                "start_seconds": start - self.started,
+                "duration_seconds": end - start
+            })
+
+    def folded(self):
+        """Stacks in folded format: one 'frame;frame;frame count' line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def save(self, path_prefix):
+        """Write <path_prefix>.folded and <path_prefix>.spans.json and return their paths"""
+        directory = os.path.dirname(path_prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        folded_path = f"{path_prefix}.folded"
+        spans_path = f"{path_prefix}.spans.json"
+        with open(folded_path, "w") as f:
+            f.write(self.folded())
+        with open(spans_path, "w") as f:
+            json.dump({"interval_seconds": self.interval, "samples": self.samples, "spans": self.spans}, f, indent=2)
+        print(f"Profile saved as '{folded_path}' ({self.samples} samples, {len(self.spans)} spans)")
+        return folded_path, spans_path
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def in_analysis(function):
+    """Wrap the target of a thread an analysis starts, so the thread is profiled with the analysis that started it"""
+    context = contextvars.copy_context()
+
+    @wraps(function)
+    def run(*args, **kwargs):
+        profiler = context.get(_current)
+        if profiler is None:
+            return function(*args, **kwargs)
+        profiler.add_thread()
+        try:
+            return context.run(function, *args, **kwargs)
+        finally:
+            profiler.remove_thread()
+    return run
+
+
+@contextmanager
+def span(name):
+    """Record the wall-clock time of a block in the profiler of the current analysis, if any"""
+    profiler = _current.get()
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record_span(name, start, time.perf_counter())
+
+
+def profiled(name):
+    """Decorator recording every call of a function as a span"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -3,6 +3,7 @@ from datetime import datetime
 from fpdf import FPDF
 import pandas as pd
 import cv2
+from Model.Profiler import profiled
 
 class ReportGenerator:
     def __init__(self, reports_dir="Reports"):
@@ -17,12 +18,15 @@ class ReportGenerator:
         self.text_color = (44, 62, 80)  # Dark Gray
         self.light_gray = (236, 240, 241)  # Light Gray
     
-    def extract_face_from_video(self, video_path):
+    def extract_face_from_video(self, video_path, time_range=None):
+        """Save the largest face found in the video, or only in time_range (start, end seconds) when given"""
         face_dir = os.path.join(self.reports_dir, "faces")
         os.makedirs(face_dir, exist_ok=True)
         
         # Output path for the face image
         video_name = os.path.splitext(os.path.basename(video_path))[0]
+        if time_range:
+            video_name += f"_{int(time_range[0])}-{int(time_range[1])}s"
         face_image_path = os.path.join(face_dir, f"{video_name}_face.jpg")
         
         # Load face detector from OpenCV
@@ -40,14 +44,26 @@ class ReportGenerator:
         face_detection_interval = 30  # Process every 30th frame to save time
         
         frame_count = 0
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
+        end_frame = None
+        
+        # Seek straight to the analyzed segment, so the rest of a long recording is never decoded
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if time_range and fps > 0:
+            frame_count = int(time_range[0] * fps)
+            end_frame = int(time_range[1] * fps)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+        
+        while end_frame is None or frame_count < end_frame:
+            # grab() skips a frame without converting it; only the sampled frames are retrieved
+            if not cap.grab():
                 break
                 
             # Process only every N frames to save time
             if frame_count % face_detection_interval == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                
                 # Convert to grayscale for face detection
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
                 
@@ -66,6 +82,8 @@ class ReportGenerator:
                         # This is now our best face
                         best_face_size = face_size
                         best_face_frame = frame.copy()
+            
+            frame_count += 1
         
         cap.release()
         
@@ -135,12 +153,19 @@ class ReportGenerator:
         
         pdf.ln(5)
     
-    def generate_report(self, file_path, results=None, analysis_image_path="deception_analysis.png"):
-        # Extract face from the video file
-        face_image_path = self.extract_face_from_video(file_path)
+    def format_time(self, seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    
+    @profiled("ReportGenerator.generate_report")
+    def generate_report(self, file_path, results=None, analysis_image_path="deception_analysis.png", time_range=None):
+        # Extract face from the video file, searching only the analyzed segment
+        face_image_path = self.extract_face_from_video(file_path, time_range)
         
         # Generate timestamp and filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Microseconds keep the names of reports generated concurrently apart
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         report_filename = f"deception_report_{timestamp}.pdf"
         report_path = os.path.join(self.reports_dir, report_filename)
         
@@ -199,7 +224,7 @@ class ReportGenerator:
         
         y = pdf.get_y()
         pdf.set_fill_color(*self.light_gray)
-        pdf.rect(10, y, content_width, 20, style='F')
+        pdf.rect(10, y, content_width, 27 if time_range else 20, style='F')
         
         pdf.set_text_color(*self.primary_color)
         pdf.set_font("Arial", "B", 12)
@@ -211,6 +236,12 @@ class ReportGenerator:
         pdf.set_xy(15, y + 12)
         pdf.cell(content_width - 10, 5, f"File: {os.path.basename(file_path)}", 0, 1)
         
+        # Only part of the video was analyzed
+        if time_range:
+            start, end = time_range
+            pdf.set_xy(15, y + 19)
+            pdf.cell(content_width - 10, 5, f"Analyzed segment: {self.format_time(start)} - {self.format_time(end)}", 0, 1)
+        
         pdf.ln(10)
         
         # Add deception analysis graph
@@ -253,12 +284,15 @@ class ReportGenerator:
                 pdf.set_text_color(*self.text_color)
                 pdf.set_font("Arial", "", 12)
                 for key, value in results.items():
-                    if isinstance(value, (int, float)):
+                    if value is None:
+                        value_str = "N/A"  # No chunk had a visible subject
+                    elif isinstance(value, (int, float)):
                         value_str = f"{value:.2f}" if isinstance(value, float) else str(value)
                     else:
                         value_str = str(value)
                     
-                    pdf.cell(95, 10, key, 1, 0)
+                    # Summary keys such as 'average_score' are shown as 'Average score'
+                    pdf.cell(95, 10, key.replace("_", " ").capitalize(), 1, 0)
                     pdf.cell(95, 10, value_str, 1, 1)
             
             elif isinstance(results, pd.DataFrame):
@@ -267,6 +301,12 @@ class ReportGenerator:
                 pdf.set_text_color(*self.primary_color)
                 pdf.set_font("Arial", "B", 12)
                 
+                # Chunks without a visible subject are reported separately and excluded from the scores
+                no_subject_percent = 0.0
+                if 'Status' in results.columns:
+                    no_subject_percent = (results['Status'] == 'no subject').mean() * 100
+                    results = results[results['Status'] == 'scored']
+                
                 # Calculate summary statistics
                 truthful_percent = (results['Deception_Score'] < 0.5).mean() * 100
                 deceptive_percent = (results['Deception_Score'] >= 0.5).mean() * 100
@@ -284,7 +324,8 @@ class ReportGenerator:
                 metrics = [
                     ("Truthful Periods", f"{truthful_percent:.1f}%"),
                     ("Deceptive Periods", f"{deceptive_percent:.1f}%"),
-                    ("Average Deception Score", f"{avg_score:.2f}")
+                    ("Average Deception Score", f"{avg_score:.2f}" if len(results) else "N/A"),
+                    ("No Subject Periods", f"{no_subject_percent:.1f}%")
                 ]
                 
                 for i, (metric, value) in enumerate(metrics):
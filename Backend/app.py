@@ -1,16 +1,21 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import shutil
 from datetime import datetime
 import uuid
-from run_prediction import DeceptionDetector
-from fpdf import FPDF
+import re
+import socket
+from run_prediction import DeceptionDetector, load_predictor
 from fastapi.responses import FileResponse, JSONResponse
-import matplotlib.pyplot as plt
 import traceback
-import pandas as pd
 from Model.ReportGenerator import ReportGenerator
+from job_store import JobStore
+from worker import JOB_DB_PATH, JOBS_DIR
+from retention import RetentionManager, policies_from_env
+from resource_scheduler import ResourceScheduler
+from Model.Profiler import Profiler, should_profile
+from timeline import read_results, query_timeline, to_records, to_columns
 import cv2
 
 app = FastAPI(title="Deception Detection System")
@@ -32,7 +37,53 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 REPORTS_DIR = "Reports"
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-deceptionDetector = DeceptionDetector()
+# Profiles of /report requests
+PROFILES_DIR = "Profiles"
+
+# Working directories of /report analyses, one per request so concurrent requests never share files
+ANALYSES_DIR = "Analyses"
+
+# Results of the latest /report analysis, served by /prediction-data
+LATEST_RESULTS_FILE = "prediction_results.csv"
+
+# Queue of analyses processed by worker.py processes, which may run on other hosts sharing the filesystem
+job_store = JobStore(JOB_DB_PATH)
+
+# Shares the CPU cores between concurrent analyses and their decode, extraction and inference stages,
+# counting the jobs that worker.py processes on this host are running as well
+host_prefix = f"{socket.gethostname()}-"
+resource_scheduler = ResourceScheduler(job_source=lambda: job_store.running_job_ids(host_prefix))
+resource_scheduler.configure_tensorflow()
+
+# Stage busy times and queue occupancy of the last pipelined /report analysis
+last_pipeline_stats = None
+
+# Evicts old and least recently used files from Videos/, Reports/, Reports/faces/, the AU cache, Jobs/ and
+# Profiles/ to keep them within their quotas. The videos and job directories of queued or running jobs are
+# pinned so they are never removed while in use.
+retention_manager = RetentionManager(
+    policies_from_env(),
+    interval=float(os.getenv("RETENTION_SWEEP_INTERVAL", "600")),
+    pin_sources=[
+        job_store.active_video_paths,
+        lambda: [os.path.join(JOBS_DIR, job_id) for job_id in job_store.active_job_ids()]
+    ]
+)
+
+@app.on_event("startup")
+async def start_retention_sweeper():
+    retention_manager.start()
+
+@app.on_event("startup")
+async def load_models():
+    # Load the ensemble and trace and warm up its batch buckets before the first request, or
+    # connect to the inference server when INFERENCE_SERVER_ADDRESS is set
+    load_predictor(os.getenv("MODEL_PRECISION") or "float32")
+
+@app.on_event("shutdown")
+async def stop_retention_sweeper():
+    retention_manager.stop()
+
 @app.get("/ping")
 async def ping():
     return {"status": "ok", "message": "pong"}
@@ -82,8 +133,13 @@ async def upload_video(
         }
     }
 
+# A plain def, so FastAPI runs each analysis in its threadpool and concurrent requests share the cores
 @app.get("/report")
-async def get_report(filePath: str):
+def get_report(filePath: str, stream: bool = False, pipelined: bool = False, profile: bool = False,
+               start_time: float = Query(None, ge=0), end_time: float = Query(None, gt=0)):
+    global last_pipeline_stats
+    profiler = None
+    analysis_dir = os.path.join(ANALYSES_DIR, uuid.uuid4().hex)
     try:
         # Get video frame rate using OpenCV
         cap = cv2.VideoCapture(filePath)
@@ -91,15 +147,44 @@ async def get_report(filePath: str):
         cap.release()
         print(f"Video frame rate: {fps} FPS")
         
-        results = deceptionDetector.process_video(filePath)
+        # Profile on request, or for a sample of analyses (PROFILE_SAMPLE_PERCENT)
+        if should_profile(profile):
+            profiler = Profiler()
+            profiler.start()
         
-        # Use the ReportGenerator class to create the PDF report
-        report_generator = ReportGenerator(reports_dir=REPORTS_DIR)
-        report_path = report_generator.generate_report(
-            file_path=filePath,
-            results=results,
-            analysis_image_path="deception_analysis.png"
-        )
+        # Keep the video from being evicted while it is analyzed
+        with retention_manager.pinned(filePath):
+            # Streaming mode keeps memory flat for long recordings and returns summary statistics only;
+            # pipelined mode also overlaps decoding, AU extraction and inference
+            # With start_time/end_time (seconds) only that part of the video is analyzed
+            detector = DeceptionDetector(work_dir=analysis_dir, output_dir=analysis_dir, scheduler=resource_scheduler)
+            results = detector.process_video(
+                filePath, stream=stream, pipelined=pipelined, start_time=start_time, end_time=end_time
+            )
+            
+            # Use the ReportGenerator class to create the PDF report
+            report_generator = ReportGenerator(reports_dir=REPORTS_DIR)
+            report_path = report_generator.generate_report(
+                file_path=filePath,
+                results=results,
+                analysis_image_path=detector.plot_file,
+                time_range=detector.analyzed_range
+            )
+        
+        # Publish the results for /prediction-data; the file is replaced at once so readers never see part of it
+        if os.path.exists(detector.results_file):
+            temp_path = f"{LATEST_RESULTS_FILE}.{uuid.uuid4().hex[:8]}.tmp"
+            shutil.copyfile(detector.results_file, temp_path)
+            os.replace(temp_path, LATEST_RESULTS_FILE)
+        if detector.last_pipeline_stats is not None:
+            last_pipeline_stats = detector.last_pipeline_stats
+        
+        headers = None
+        if profiler is not None:
+            profiler.stop()
+            profile_id = uuid.uuid4().hex
+            profiler.save(os.path.join(PROFILES_DIR, profile_id))
+            headers = {"X-Profile-Id": profile_id, "Access-Control-Expose-Headers": "X-Profile-Id"}
         
         # Get the report filename from the path
         report_filename = os.path.basename(report_path)
@@ -108,29 +193,67 @@ async def get_report(filePath: str):
         return FileResponse(
             path="Reports/" + report_filename,
             filename=report_filename,
-            media_type="application/pdf"
+            media_type="application/pdf",
+            headers=headers
         )
     except Exception as e:
         print("An error occurred: ", e)
         print(traceback.format_exc())
         return {"status": "error", "message": str(e)}
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        shutil.rmtree(analysis_dir, ignore_errors=True)
+
+class TimelineQuery:
+    """Query parameters shared by the prediction data endpoints"""
+
+    def __init__(
+        self,
+        start_time: float = Query(None, ge=0, description="First chunk start time to return, in seconds"),
+        end_time: float = Query(None, ge=0, description="Last chunk start time to return, in seconds"),
+        page: int = Query(None, ge=0, description="Page number, starting at 0"),
+        page_size: int = Query(1000, ge=1, le=100000),
+        max_points: int = Query(None, ge=3, description="Downsample to at most this many points"),
+        format: str = Query("records", pattern="^(records|columns)$", description="'records' or compact 'columns'")
+    ):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.page = page
+        self.page_size = page_size
+        self.max_points = max_points
+        self.format = format
+
+def prediction_data_response(results_path, query=None):
+    """Return a prediction results CSV as JSON, optionally limited to a time range, a page or a point count"""
+    if not results_path or not os.path.exists(results_path):
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "Prediction data not found. Run a report first."}
+        )
+    
+    # Read the CSV file; repeated page and range queries reuse the parsed file
+    prediction_data = read_results(results_path)
+    if query is None:
+        return JSONResponse(content={"status": "success", "data": to_records(prediction_data)})
+    
+    prediction_data, meta = query_timeline(
+        prediction_data,
+        start_time=query.start_time,
+        end_time=query.end_time,
+        page=query.page,
+        page_size=query.page_size,
+        max_points=query.max_points
+    )
+    
+    # Chunks without a visible subject have no score; both encodings send them as null rather than NaN
+    data = to_columns(prediction_data) if query.format == "columns" else to_records(prediction_data)
+    return JSONResponse(content={"status": "success", "format": query.format, **meta, "data": data})
 
 @app.get("/prediction-data")
-async def get_prediction_data():
+async def get_prediction_data(query: TimelineQuery = Depends()):
     try:
-        if os.path.exists("prediction_results.csv"):
-            # Read the CSV file
-            prediction_data = pd.read_csv("prediction_results.csv")
-            
-            # Convert to dictionary format
-            data_dict = prediction_data.to_dict(orient='records')
-            
-            return JSONResponse(content={"status": "success", "data": data_dict})
-        else:
-            return JSONResponse(
-                status_code=404,
-                content={"status": "error", "message": "Prediction data not found. Run a report first."}
-            )
+        return prediction_data_response(LATEST_RESULTS_FILE, query)
     except Exception as e:
         print("An error occurred: ", e)
         print(traceback.format_exc())
@@ -139,6 +262,96 @@ async def get_prediction_data():
             content={"status": "error", "message": str(e)}
         )
 
+@app.post("/jobs")
+async def create_job(filePath: str, stream: bool = False, pipelined: bool = False, profile: bool = False,
+                     start_time: float = Query(None, ge=0), end_time: float = Query(None, gt=0)):
+    # Only queue the analysis; a worker process picks it up
+    if not os.path.exists(filePath):
+        raise HTTPException(status_code=404, detail=f"Video file not found: {filePath}")
+    job_id = job_store.enqueue(filePath, {
+        "stream": stream, "pipelined": pipelined, "profile": profile, "start_time": start_time, "end_time": end_time
+    })
+    return {"status": "success", "job_id": job_id}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "success", "job": job}
+
+@app.get("/jobs/{job_id}/report")
+async def get_job_report(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "done":
+        return JSONResponse(
+            status_code=409,
+            content={"status": "error", "message": f"Job is {job['status']}", "job_status": job["status"]}
+        )
+    if not job["report_path"] or not os.path.exists(job["report_path"]):
+        # Finished jobs' directories are removed by the retention sweeper once they expire
+        raise HTTPException(status_code=410, detail="Job report has expired")
+    return FileResponse(
+        path=job["report_path"],
+        filename=os.path.basename(job["report_path"]),
+        media_type="application/pdf"
+    )
+
+@app.get("/jobs/{job_id}/prediction-data")
+async def get_job_prediction_data(job_id: str, query: TimelineQuery = Depends()):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return prediction_data_response(job["results_path"], query)
+
+def profile_response(path_prefix, format):
+    """Return a saved profile as folded stacks or as its span timings"""
+    path = f"{path_prefix}.spans.json" if format == "spans" else f"{path_prefix}.folded"
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "application/json" if format == "spans" else "text/plain"
+    return FileResponse(path=path, filename=os.path.basename(path), media_type=media_type)
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = Query("folded", pattern="^(folded|spans)$")):
+    # Profile of a /report request, identified by its X-Profile-Id response header
+    if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile_response(os.path.join(PROFILES_DIR, profile_id), format)
+
+@app.get("/jobs/{job_id}/profile")
+async def get_job_profile(job_id: str, format: str = Query("folded", pattern="^(folded|spans)$")):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return profile_response(os.path.join(JOBS_DIR, job_id, "profile"), format)
+
+@app.get("/scheduler")
+async def get_scheduler_allocation():
+    # Cores currently assigned to each running analysis and stage
+    return {"status": "success", "scheduler": resource_scheduler.snapshot()}
+
+@app.get("/pipeline-stats")
+async def get_pipeline_stats():
+    # Stage busy times and queue occupancy of the last pipelined analysis
+    if last_pipeline_stats is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "No pipelined analysis has run yet."}
+        )
+    return {"status": "success", "pipeline": last_pipeline_stats}
+
+@app.get("/retention")
+async def get_retention_metrics():
+    # Disk usage, quotas and space reclaimed by the retention sweeper
+    return {"status": "success", "retention": retention_manager.metrics()}
+
+@app.post("/retention/sweep")
+async def run_retention_sweep():
+    return {"status": "success", "sweep": retention_manager.sweep()}
+
 @app.get("/video/{video_path:path}")
 async def get_video(video_path: str):
     try:
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+class AUCache:
+    """Action Units extracted from videos, stored as one CSV per chunk of the analysis timeline.
+
+    Entries are keyed by the video file (path, size and modification time) and the extraction settings,
+    so a replaced file or different settings never reuse stale AUs. Evicting single chunk files is safe:
+    missing chunks are extracted again on the next request that needs them, and a chunk evicted while a
+    request is reading the range is scored as frames without a subject.
+    """
+
+    def __init__(self, cache_dir="AU_cache"):
+        self.cache_dir = cache_dir
+
+    def video_key(self, video_path, **settings):
+        stat = os.stat(video_path)
+        identity = "|".join(
+            [os.path.abspath(video_path), str(stat.st_size), str(stat.st_mtime_ns)]
+            + [f"{name}={value}" for name, value in sorted(settings.items())]
+        )
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        return f"{name}_{hashlib.sha1(identity.encode('utf-8')).hexdigest()[:12]}"
+
+    def chunk_path(self, key, chunk_index):
+        return os.path.join(self.cache_dir, key, f"chunk_{chunk_index}.csv")
+
+    def missing_runs(self, key, first_chunk, last_chunk):
+        """Contiguous (start, end) chunk ranges within [first_chunk, last_chunk) that are not cached"""
+        runs = []
+        for chunk_index in range(first_chunk, last_chunk):
+            if os.path.exists(self.chunk_path(key, chunk_index)):
+                continue
+            if runs and runs[-1][1] == chunk_index:
+                runs[-1] = (runs[-1][0], chunk_index + 1)
+            else:
+                runs.append((chunk_index, chunk_index + 1))
+        return runs
+
+    def store(self, key, chunk_index, frame):
+        path = self.chunk_path(key, chunk_index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so concurrent readers never see a partial chunk
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        frame.to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    def load(self, key, first_chunk, last_chunk, chunk_size):
+        """Cached chunks [first_chunk, last_chunk) concatenated in order.
+
+        A chunk evicted since it was extracted is filled with chunk_size frames without a subject (success=0),
+        so the chunks after it keep their times.
+        """
+        frames = []
+        missing = []
+        for chunk_index in range(first_chunk, last_chunk):
+            try:
+                frames.append(pd.read_csv(self.chunk_path(key, chunk_index)))
+            except FileNotFoundError:
+                missing.append(chunk_index)
+                frames.append(pd.DataFrame({"success": np.zeros(chunk_size)}))
+        if len(missing) == last_chunk - first_chunk:
+            raise Exception("No Action Units were extracted for the requested time range.")
+        if missing:
+            print(f"Warning: Action Units of chunks {missing} were removed from the cache; they are scored as frames without a subject")
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,196 @@
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from resource_scheduler import available_cores
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".wmv", ".ogv", ".ogg")
+MANIFEST_NAME = "batch_manifest.json"
+SUMMARY_NAME = "batch_summary.csv"
+
+
+def collect_videos(inputs):
+    """Expand directories, glob patterns and manifest files (one path per line) into video paths"""
+    videos = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    videos.append(os.path.join(item, name))
+        elif os.path.isfile(item) and not item.lower().endswith(VIDEO_EXTENSIONS):
+            with open(item) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        videos.append(line)
+        else:
+            matches = sorted(glob.glob(item))
+            if not matches:
+                print(f"Warning: No videos matched {item}")
+            videos.extend(matches)
+
+    # Remove duplicates while keeping the order
+    seen = set()
+    unique_videos = []
+    for video in videos:
+        video = os.path.abspath(video)
+        if video not in seen:
+            seen.add(video)
+            unique_videos.append(video)
+    return unique_videos
+
+
+def video_output_dir(output_dir, video_path):
+    """Per-video output directory; the path hash keeps videos with the same name apart"""
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    path_hash = hashlib.sha1(video_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_dir, f"{name}_{path_hash}")
+
+
+def load_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(output_dir, manifest):
+    # Write to a temporary file first so an interrupted run never leaves a corrupt manifest
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+# Scheduler of the worker process, over the cores reserved for it
+_scheduler = None
+
+
+def init_worker(core_slices):
+    """Give the worker process its own slice of the cores, so concurrent videos never compete for one"""
+    global _scheduler
+    from resource_scheduler import ResourceScheduler
+
+    _scheduler = ResourceScheduler(cores=core_slices.get())
+    _scheduler.configure_tensorflow()
+
+
+def split_cores(cores, workers):
+    """Even contiguous slices of the cores, one per worker process"""
+    return [cores[i * len(cores) // workers:(i + 1) * len(cores) // workers] or [cores[i % len(cores)]] for i in range(workers)]
+
+
+def analyze_video(video_path, item_dir, detector_options):
+    """Run the full pipeline on one video in its own directories (executed in a worker process)"""
+    # Imported here so TensorFlow is only loaded inside the worker processes
+    from run_prediction import DeceptionDetector, summarize_results
+
+    work_dir = os.path.join(item_dir, "work")
+    detector = DeceptionDetector(work_dir=work_dir, output_dir=item_dir, scheduler=_scheduler, **detector_options)
+    results = detector.process_video(video_path)
+    if results is None:
+        raise RuntimeError(f"Video could not be processed: {video_path}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = summarize_results(results)
+    summary["results_file"] = detector.results_file
+    return summary
+
+
+def write_summary(output_dir, manifest):
+    rows = []
+    for video_path, entry in manifest.items():
+        row = {"video": video_path, "status": entry["status"], "error": entry.get("error")}
+        row.update(entry.get("summary") or {})
+        rows.append(row)
+    summary_path = os.path.join(output_dir, SUMMARY_NAME)
+    pd.DataFrame(rows).to_csv(summary_path, index=False)
+    print(f"Summary saved to {summary_path}")
+
+
+def run_batch(videos, output_dir, workers, detector_options, retry_failed=False):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    # Skip videos that finished in a previous run; anything left "running" was interrupted and is redone
+    pending = []
+    for video_path in videos:
+        entry = manifest.get(video_path)
+        if entry and entry["status"] == "done" and os.path.exists(entry["summary"]["results_file"]):
+            continue
+        if entry and entry["status"] == "failed" and not retry_failed:
+            continue
+        manifest[video_path] = {"status": "pending", "output_dir": video_output_dir(output_dir, video_path)}
+        pending.append(video_path)
+    save_manifest(output_dir, manifest)
+    print(f"{len(videos)} videos, {len(videos) - len(pending)} already processed, {len(pending)} to run with {workers} workers")
+
+    # Spawned workers start with a clean interpreter, which TensorFlow and OpenCV handle better than fork
+    context = multiprocessing.get_context("spawn")
+    core_slices = context.Queue()
+    for cores in split_cores(available_cores(), workers):
+        core_slices.put(cores)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(core_slices,)) as executor:
+        futures = {}
+        for video_path in pending:
+            item_dir = manifest[video_path]["output_dir"]
+            futures[executor.submit(analyze_video, video_path, item_dir, detector_options)] = video_path
+            manifest[video_path]["status"] = "running"
+            manifest[video_path]["started_at"] = datetime.now().isoformat()
+        save_manifest(output_dir, manifest)
+
+        completed = 0
+        for future in as_completed(futures):
+            video_path = futures[future]
+            entry = manifest[video_path]
+            entry["finished_at"] = datetime.now().isoformat()
+            try:
+                entry["summary"] = future.result()
+                entry["status"] = "done"
+                entry.pop("error", None)
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                print(f"Error processing {video_path}: {e}")
+                print(traceback.format_exc())
+            completed += 1
+            save_manifest(output_dir, manifest)
+            print(f"[{completed}/{len(pending)}] {entry['status']}: {video_path}")
+
+    write_summary(output_dir, manifest)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run deception detection on many videos in parallel")
+    parser.add_argument("inputs", nargs="+", help="Video directories, glob patterns or text files listing one video path per line")
+    parser.add_argument("--output-dir", "-o", default="batch_results", help="Directory for per-video results, the manifest and the summary (default: batch_results)")
+    parser.add_argument("--workers", "-w", type=int, default=2, help="Number of videos processed at the same time (default: 2)")
+    parser.add_argument("--retry-failed", action="store_true", help="Run videos that failed in a previous run again")
+    parser.add_argument("--min-face-coverage", type=float, default=0.5, help="Minimum fraction of frames with a detected face for a chunk to be scored (default: 0.5)")
+    parser.add_argument("--no-crop", action="store_true", help="Disable cropping frames to the face region")
+
+    args = parser.parse_args()
+
+    videos = collect_videos(args.inputs)
+    if not videos:
+        parser.error("No videos found")
+
+    run_batch(
+        videos,
+        args.output_dir,
+        workers=max(1, args.workers),
+        detector_options={"min_face_coverage": args.min_face_coverage, "crop_faces": not args.no_crop},
+        retry_failed=args.retry_failed
+    )
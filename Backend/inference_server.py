@@ -0,0 +1,289 @@
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from dotenv import load_dotenv
+
+from Model.ModelPredictor import EnsemblePredictor
+
+load_dotenv()
+
+# A named pipe on Windows, a Unix domain socket elsewhere
+DEFAULT_ADDRESS = r"\\.\pipe\deception-inference" if os.name == "nt" else "inference.sock"
+
+
+def key_file(address):
+    """File holding the authentication key the server generates when INFERENCE_SERVER_AUTHKEY is not set"""
+    return "inference.key" if os.name == "nt" else f"{address}.key"
+
+
+def load_authkey(address, create=False):
+    """Key that clients must prove they hold before the server accepts (and unpickles) their requests.
+
+    INFERENCE_SERVER_AUTHKEY (hex) is used if set. Otherwise the server generates a key and writes it to a
+    file only its user can read, where clients run by the same user find it.
+    """
+    value = os.getenv("INFERENCE_SERVER_AUTHKEY")
+    if value:
+        return bytes.fromhex(value)
+    path = key_file(address)
+    if create:
+        key = secrets.token_bytes(32)
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as f:
+            f.write(key.hex())
+        os.chmod(path, 0o600)  # In case an older file had other permissions
+        return key
+    if not os.path.exists(path):
+        raise ConnectionError(f"No authentication key for the inference server: set INFERENCE_SERVER_AUTHKEY or start the server to create {path}")
+    with open(path) as f:
+        return bytes.fromhex(f.read().strip())
+
+
+class InferenceServer:
+    """Owns the ensemble and scores windows for every analysis process on the machine.
+
+    Each client connection is served by its own thread, which queues its request and waits for the
+    result. A single inference thread takes the queued requests together, waiting up to batch_wait
+    seconds for more to arrive, and runs each ensemble member once on the concatenated windows of
+    all requests that need it, so concurrent analyses share batches instead of running one by one.
+    """
+
+    def __init__(self, predictor, address=DEFAULT_ADDRESS, batch_wait=0.005, max_batch_windows=4096):
+        self.predictor = predictor
+        self.address = address
+        self.batch_wait = batch_wait
+        self.max_batch_windows = max_batch_windows
+        self.requests = queue.Queue()
+        self.stopped = threading.Event()
+        self.listener = None
+        self.stats = {"connections": 0, "requests": 0, "batches": 0, "windows": 0}
+        self.stats_lock = threading.Lock()
+
+    def info(self):
+        return {
+            "precision": self.predictor.precision,
+            "metadata": self.predictor.metadata,
+            "members": len(self.predictor.models),
+        }
+
+    def serve_forever(self):
+        if os.name != "nt" and os.path.exists(self.address):
+            # Left behind by a server that did not shut down cleanly
+            os.remove(self.address)
+        authkey = load_authkey(self.address, create=True)
+        if os.name != "nt":
+            # Only this user may connect to the socket; it is created with these permissions, so there is no window
+            previous_umask = os.umask(0o177)
+            try:
+                self.listener = Listener(self.address, authkey=authkey)
+            finally:
+                os.umask(previous_umask)
+            os.chmod(self.address, 0o600)
+        else:
+            self.listener = Listener(self.address, authkey=authkey)
+        threading.Thread(target=self._run_batches, daemon=True).start()
+        print(f"Inference server listening on {self.address}")
+        try:
+            while not self.stopped.is_set():
+                try:
+                    connection = self.listener.accept()
+                except AuthenticationError:
+                    print("Warning: Rejected a connection with the wrong authentication key")
+                    continue
+                except OSError:
+                    break  # The listener was closed by stop()
+                with self.stats_lock:
+                    self.stats["connections"] += 1
+                threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopped.set()
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def _handle(self, connection):
+        """Answer the requests of one client connection until it is closed"""
+        with connection:
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    return
+                kind = message[0]
+                if kind == "info":
+                    connection.send(("ok", self.info()))
+                elif kind == "stats":
+                    with self.stats_lock:
+                        connection.send(("ok", dict(self.stats)))
+                elif kind == "predict":
+                    # member is an ensemble member index, or None for all members
+                    _, member, X = message
+                    future = Future()
+                    self.requests.put((member, X, future))
+                    try:
+                        connection.send(("ok", future.result()))
+                    except Exception as e:
+                        connection.send(("error", str(e)))
+                else:
+                    connection.send(("error", f"Unknown request {kind!r}"))
+
+    def _run_batches(self):
+        while not self.stopped.is_set():
+            try:
+                batch = [self.requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            windows = len(batch[0][1])
+            deadline = time.monotonic() + self.batch_wait
+            while windows < self.max_batch_windows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                windows += len(request[1])
+            self._score(batch)
+
+    def _score(self, batch):
+        """Run each member once on the windows of every request in the batch that needs it"""
+        try:
+            members = len(self.predictor.models)
+            outputs = [np.zeros((len(X), members if member is None else 1)) for member, X, _ in batch]
+            for m, model in enumerate(self.predictor.models):
+                needed = [i for i, (member, _, _) in enumerate(batch) if member is None or member == m]
+                if not needed:
+                    continue
+                X = np.concatenate([batch[i][1] for i in needed])
+                probabilities = model.predict(X, verbose=0).flatten()
+                start = 0
+                for i in needed:
+                    member, request_X, _ = batch[i]
+                    outputs[i][:, m if member is None else 0] = probabilities[start:start + len(request_X)]
+                    start += len(request_X)
+        except Exception as e:
+            print(f"Error scoring a batch of {len(batch)} requests: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self.stats_lock:
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["windows"] += sum(len(X) for _, X, _ in batch)
+        for output, (_, _, future) in zip(outputs, batch):
+            future.set_result(output)
+
+
+class InferenceClient:
+    """Connection to an InferenceServer; each thread gets its own connection so their requests can be batched together"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, connect_timeout=60):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.authkey = None
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # The server may still be loading and warming up the models
+            deadline = time.time() + self.connect_timeout
+            while True:
+                try:
+                    # Read the key once the server is up, since it may generate a new one at startup
+                    if self.authkey is None:
+                        self.authkey = load_authkey(self.address)
+                    connection = Client(self.address, authkey=self.authkey)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError, ConnectionError, AuthenticationError):
+                    if time.time() >= deadline:
+                        raise ConnectionError(f"No inference server accepted the connection on {self.address} (not running, or a different authentication key). "
+                                              "Start one with: python inference_server.py")
+                    self.authkey = None
+                    time.sleep(0.5)
+            self.local.connection = connection
+        return connection
+
+    def request(self, *message):
+        connection = self._connection()
+        try:
+            connection.send(message)
+            status, payload = connection.recv()
+        except (EOFError, OSError):
+            # Reconnect on the next request, e.g. after the server was restarted with a new key
+            connection.close()
+            self.local.connection = None
+            self.authkey = None
+            raise ConnectionError(f"Lost the connection to the inference server at {self.address}")
+        if status != "ok":
+            raise RuntimeError(f"Inference server error: {payload}")
+        return payload
+
+    def predict(self, X, member=None):
+        return self.request("predict", member, np.asarray(X, dtype=np.float32))
+
+
+class RemoteMember:
+    """Ensemble member scored by the inference server, with the predict() interface of a Keras model"""
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+
+    def predict(self, X, batch_size=None, verbose=0):
+        return self.client.predict(X, member=self.index)
+
+
+class RemotePredictor(EnsemblePredictor):
+    """EnsemblePredictor whose models live in an InferenceServer process.
+
+    Preprocessing, face gating, cascade decisions and results are computed locally as usual; only
+    the member predictions are sent to the server, so this process never loads the models.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, precision='float32', cascade=False, cascade_confidence=None,
+                 cascade_audit=False, connect_timeout=60):
+        self.client = InferenceClient(address, connect_timeout)
+        info = self.client.request("info")
+        if info["precision"] != precision:
+            raise ValueError(f"The inference server at {address} serves the {info['precision']} ensemble, not {precision}")
+        super().__init__(
+            precision=precision, cascade=cascade, cascade_confidence=cascade_confidence, cascade_audit=cascade_audit,
+            metadata=info["metadata"], models=[RemoteMember(self.client, i) for i in range(info["members"])]
+        )
+        print(f"Using {info['members']} {precision} models from the inference server at {address}")
+
+    def member_probabilities(self, X, batch_size=None):
+        # All members in one round trip
+        return self.client.predict(X)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve ensemble predictions to the API and worker processes on this machine")
+    parser.add_argument("--address", default=os.getenv("INFERENCE_SERVER_ADDRESS") or DEFAULT_ADDRESS,
+                        help=f"Unix socket path, or named pipe on Windows (default: INFERENCE_SERVER_ADDRESS or {DEFAULT_ADDRESS})")
+    parser.add_argument("--precision", default=os.getenv("MODEL_PRECISION") or "float32", help="Ensemble precision to serve (default: MODEL_PRECISION or float32)")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0, help="How long to wait for other requests to batch with (default: 5)")
+
+    args = parser.parse_args()
+
+    server = InferenceServer(EnsemblePredictor(precision=args.precision), args.address, batch_wait=args.batch_wait_ms / 1000)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Inference server stopped")
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class JobStore:
+    """Durable queue of video analysis jobs and their results, stored in a SQLite database file.
+
+    Any number of worker processes, on this host or on others sharing the filesystem, can lease jobs
+    from the same database. A leased job must be renewed with heartbeat(); if its worker dies the
+    lease expires and another worker picks the job up again, up to max_attempts times.
+    """
+
+    def __init__(self, db_path="jobs.db", lease_seconds=120, max_attempts=3, retry_delay=30):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay  # Seconds before a failed job is retried, multiplied by the attempt number
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    video_path TEXT NOT NULL,
+                    options TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    heartbeat_at REAL,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    results_path TEXT,
+                    report_path TEXT,
+                    summary TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit mode so transactions are controlled explicitly with BEGIN IMMEDIATE. The default
+        # rollback journal is kept (no WAL) because WAL does not work on network filesystems.
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+        return job
+
+    def enqueue(self, video_path, options=None):
+        """Add a video analysis job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, video_path, options, status, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, video_path, json.dumps(options or {}), now, now, now)
+            )
+        return job_id
+
+    def lease(self, worker_id):
+        """Claim the oldest available job for worker_id, or return None if there is none"""
+        now = time.time()
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock, so two workers can never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker stopped sending heartbeats are either retried or given up
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Lease expired too many times', updated_at = ? "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                    "OR (status = 'running' AND lease_expires < ?) ORDER BY created_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                        "lease_expires = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                        (worker_id, now + self.lease_seconds, now, now, row["id"])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease of a running job. Returns False if the worker no longer holds it"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, heartbeat_at = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + self.lease_seconds, now, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, results_path=None, report_path=None, summary=None):
+        """Store the results of a job. Returns False if the worker no longer holds the lease"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', results_path = ?, report_path = ?, summary = ?, error = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (results_path, report_path, json.dumps(summary) if summary is not None else None, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt; the job is queued again until it runs out of attempts"""
+        now = time.time()
+        with self._connect() as conn:
+            job = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return
+            if job["attempts"] < self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, lease_expires = NULL, updated_at = ? "
+                    "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                    (error, now + self.retry_delay * job["attempts"], now, job_id, worker_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_expires = NULL, updated_at = ? "
+                    "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                    (error, now, job_id, worker_id)
+                )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, status=None, limit=100):
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            return [self._to_dict(row) for row in rows]
+
+    def active_video_paths(self):
+        """Videos of jobs that are queued or running, which must not be deleted"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT video_path FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            return [row["video_path"] for row in rows]
+
+    def active_job_ids(self):
+        """Ids of jobs that are queued or running, whose job directories must not be deleted"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            return [row["id"] for row in rows]
+
+    def running_job_ids(self, worker_prefix=""):
+        """Ids of jobs currently leased by workers whose id starts with worker_prefix (e.g. the workers on one host)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND lease_expires >= ? AND substr(worker_id, 1, ?) = ?",
+                (time.time(), len(worker_prefix), worker_prefix)
+            ).fetchall()
+            return [row["id"] for row in rows]
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ("upload", "report", "video", "prediction")
+
+# Stand-in for OpenFace's FeatureExtraction: writes one row of random action units per image in -fdir,
+# with the columns the real tool writes, after sleeping delay seconds per image to mimic its cost
+STUB_OPENFACE = '''#!{python}
+import os, random, sys, time
+
+AUS_R = ["AU01", "AU02", "AU04", "AU05", "AU06", "AU07", "AU09", "AU10", "AU12", "AU14", "AU15", "AU17", "AU20", "AU23", "AU25", "AU26", "AU45"]
+AUS_C = AUS_R[:-1] + ["AU28", "AU45"]
+
+args = sys.argv[1:]
+option = lambda name: args[args.index(name) + 1]
+images = sorted(name for name in os.listdir(option("-fdir")) if name.endswith(".jpg"))
+time.sleep({delay} * len(images))
+
+columns = ["frame", "face_id", "timestamp", "confidence", "success"] + [au + "_r" for au in AUS_R] + [au + "_c" for au in AUS_C]
+os.makedirs(option("-out_dir"), exist_ok=True)
+with open(os.path.join(option("-out_dir"), option("-of")), "w") as f:
+    f.write(", ".join(columns) + "\\n")
+    for i in range(len(images)):
+        values = [i + 1, 0, i / 30, 0.98, 1] + [random.uniform(0, 5) for _ in AUS_R] + [random.randint(0, 1) for _ in AUS_C]
+        f.write(", ".join(str(value) for value in values) + "\\n")
+'''
+
+
+def write_stub_openface(directory, delay=0.0):
+    """Write the stand-in OpenFace executable and return its path"""
+    path = os.path.join(directory, "FeatureExtraction")
+    with open(path, "w") as f:
+        f.write(STUB_OPENFACE.format(python=sys.executable, delay=delay))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def make_synthetic_video(path, seconds=10, fps=30, size=(640, 480)):
+    """Write a video of a moving face-like shape with cv2.VideoWriter"""
+    import cv2
+
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for i in range(int(seconds * fps)):
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        center = (int(width / 2 + width / 6 * np.sin(i / fps)), height // 2)
+        cv2.ellipse(frame, center, (70, 90), 0, 0, 360, (150, 180, 220), -1)
+        cv2.circle(frame, (center[0] - 25, center[1] - 20), 8, (30, 30, 30), -1)
+        cv2.circle(frame, (center[0] + 25, center[1] - 20), 8, (30, 30, 30), -1)
+        cv2.ellipse(frame, (center[0], center[1] + 35), (25, 8 + 6 * (i % 15 > 7)), 0, 0, 180, (60, 60, 160), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def start_server(work_dir, port, openface_path):
+    """Start the API with uvicorn in work_dir, so uploads, reports and results stay out of the repository"""
+    os.symlink(os.path.join(BACKEND_DIR, "Model"), os.path.join(work_dir, "Model"))
+    env = os.environ.copy()
+    env.update({
+        "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+        "OPENFACE_PATH": openface_path,
+        "JOB_DB_PATH": os.path.join(work_dir, "jobs.db"),
+        "JOBS_DIR": os.path.join(work_dir, "Jobs"),
+        "PROFILE_SAMPLE_PERCENT": "0",
+    })
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return process
+
+
+def wait_for_server(base_url, process, timeout=600):
+    """Wait until /ping answers; loading and warming up the models can take a while"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("The server exited during startup, see server.log")
+        try:
+            with urllib.request.urlopen(f"{base_url}/ping", timeout=5):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(1)
+    raise RuntimeError(f"The server did not start within {timeout} seconds")
+
+
+def request(method, url, body=None, headers=None, timeout=600):
+    """Send a request and return (status, headers, body); HTTP errors are returned, not raised"""
+    req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def failed(status, headers, body):
+    """The API also reports errors as 200 responses with {"status": "error"}"""
+    if status >= 400:
+        return True
+    if "application/json" in (headers.get("Content-Type") or ""):
+        try:
+            return json.loads(body).get("status") == "error"
+        except (ValueError, AttributeError):
+            return True
+    return False
+
+
+class LoadTest:
+    """Drives a mix of API requests from concurrent clients and records per-endpoint latencies"""
+
+    def __init__(self, base_url, videos, mix, concurrency=4, duration=60, range_bytes=256 * 1024):
+        self.base_url = base_url
+        self.videos = videos
+        self.mix = mix  # Relative weight of each endpoint
+        self.concurrency = concurrency
+        self.duration = duration
+        self.range_bytes = range_bytes
+        self.uploaded = []  # (file_path, size) of uploaded videos
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}  # (latency, failed)
+        self.errors = {endpoint: {} for endpoint in ENDPOINTS}
+        self.lock = threading.Lock()
+
+    def upload(self):
+        video = random.choice(self.videos)
+        boundary = uuid.uuid4().hex
+        with open(video, "rb") as f:
+            content = f.read()
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{os.path.basename(video)}\"\r\n"
+            f"Content-Type: video/mp4\r\n\r\n"
+        ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+        response = request("POST", f"{self.base_url}/upload-video", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        if not failed(*response):
+            details = json.loads(response[2])["details"]
+            with self.lock:
+                self.uploaded.append((details["file_path"], len(content)))
+        return response
+
+    def report(self):
+        file_path, _ = random.choice(self.uploaded)
+        return request("GET", f"{self.base_url}/report?filePath={quote(file_path)}")
+
+    def video(self):
+        # Seeking in the player issues range reads at random offsets
+        file_path, size = random.choice(self.uploaded)
+        start = random.randrange(0, max(1, size - self.range_bytes))
+        headers = {"Range": f"bytes={start}-{start + self.range_bytes - 1}"}
+        return request("GET", f"{self.base_url}/video/{quote(os.path.basename(file_path))}", headers=headers)
+
+    def prediction(self):
+        return request("GET", f"{self.base_url}/prediction-data?max_points=2000")
+
+    def run_one(self, endpoint):
+        start = time.perf_counter()
+        try:
+            status, headers, body = getattr(self, endpoint)()
+            is_error = failed(status, headers, body)
+            error = f"HTTP {status}" if is_error else None
+        except Exception as e:
+            is_error = True
+            error = type(e).__name__
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.samples[endpoint].append((latency, is_error))
+            if error:
+                self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+    def prepare(self):
+        """Upload a video and analyze it once, so reads have something to fetch"""
+        print("Uploading a video and running a first report...")
+        status, headers, body = self.upload()
+        if failed(status, headers, body):
+            raise RuntimeError(f"Upload failed during preparation: HTTP {status} {body[:200]!r}")
+        status, headers, body = self.report()
+        if failed(status, headers, body):
+            raise RuntimeError(f"Report failed during preparation: HTTP {status} {body[:200]!r}")
+
+    def _client(self, deadline):
+        endpoints = [endpoint for endpoint in ENDPOINTS if self.mix.get(endpoint, 0) > 0]
+        weights = [self.mix[endpoint] for endpoint in endpoints]
+        while time.time() < deadline:
+            self.run_one(random.choices(endpoints, weights)[0])
+
+    def run(self):
+        self.prepare()
+        print(f"Running {self.concurrency} clients for {self.duration}s with mix {self.mix}")
+        deadline = time.time() + self.duration
+        started = time.perf_counter()
+        clients = [threading.Thread(target=self._client, args=(deadline,), daemon=True) for _ in range(self.concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return self.results(time.perf_counter() - started)
+
+    def results(self, elapsed):
+        results = {"elapsed_seconds": elapsed, "concurrency": self.concurrency, "mix": self.mix, "endpoints": {}}
+        for endpoint, samples in self.samples.items():
+            if not samples:
+                continue
+            latencies = np.array([latency for latency, _ in samples])
+            errors = sum(is_error for _, is_error in samples)
+            results["endpoints"][endpoint] = {
+                "requests": len(samples),
+                "throughput_per_second": len(samples) / elapsed,
+                "error_rate": errors / len(samples),
+                "errors": self.errors[endpoint],
+                "latency_seconds": {
+                    "p50": float(np.percentile(latencies, 50)),
+                    "p90": float(np.percentile(latencies, 90)),
+                    "p99": float(np.percentile(latencies, 99)),
+                    "max": float(latencies.max())
+                }
+            }
+        return results
+
+
+def print_results(results):
+    print(f"\n=== Load test: {results['concurrency']} clients, {results['elapsed_seconds']:.1f}s ===")
+    print(f"{'endpoint':<12}{'requests':>10}{'req/s':>9}{'errors':>9}{'p50 s':>9}{'p90 s':>9}{'p99 s':>9}{'max s':>9}")
+    for endpoint, stats in results["endpoints"].items():
+        latency = stats["latency_seconds"]
+        print(
+            f"{endpoint:<12}{stats['requests']:>10}{stats['throughput_per_second']:>9.2f}{stats['error_rate'] * 100:>8.1f}%"
+            f"{latency['p50']:>9.3f}{latency['p90']:>9.3f}{latency['p99']:>9.3f}{latency['max']:>9.3f}"
+        )
+        for error, count in stats["errors"].items():
+            print(f"{'':<12}{count} x {error}")
+
+
+def parse_mix(value):
+    """Parse 'upload=1,report=1,video=4,prediction=2' into endpoint weights"""
+    mix = {}
+    for part in value.split(","):
+        endpoint, _, weight = part.partition("=")
+        if endpoint.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {endpoint!r}; choose from {', '.join(ENDPOINTS)}")
+        mix[endpoint.strip()] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the API with synthetic videos and a stand-in OpenFace")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Number of concurrent clients (default: 4)")
+    parser.add_argument("--duration", "-d", type=float, default=60, help="Length of the test in seconds (default: 60)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("upload=1,report=1,video=4,prediction=2"),
+                        help="Relative weight of each endpoint (default: upload=1,report=1,video=4,prediction=2)")
+    parser.add_argument("--videos", nargs="*", help="Videos to upload instead of synthetic ones")
+    parser.add_argument("--video-seconds", type=float, default=10, help="Length of the synthetic videos (default: 10)")
+    parser.add_argument("--openface-delay", type=float, default=0.0, help="Seconds the stand-in OpenFace spends per frame (default: 0)")
+    parser.add_argument("--server-url", help="Test a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the started server (default: 8765)")
+    parser.add_argument("--output", "-o", help="Also write the results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary server directory")
+
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="deception_load_test_")
+    server = None
+    try:
+        videos = args.videos or [
+            make_synthetic_video(os.path.join(work_dir, f"synthetic_{i}.mp4"), seconds=args.video_seconds)
+            for i in range(2)
+        ]
+
+        base_url = args.server_url
+        if base_url is None:
+            server_dir = os.path.join(work_dir, "server")
+            os.makedirs(server_dir)
+            print(f"Starting the server in {server_dir}...")
+            server = start_server(server_dir, args.port, write_stub_openface(work_dir, args.openface_delay))
+            base_url = f"http://127.0.0.1:{args.port}"
+        wait_for_server(base_url.rstrip("/"), server)
+
+        results = LoadTest(base_url.rstrip("/"), videos, args.mix, args.concurrency, args.duration).run()
+        print_results(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if args.keep:
+            print(f"Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Relative share of a job's cores given to each pipeline stage
+STAGE_WEIGHTS = {"decode": 1, "extract": 2, "inference": 1}
+
+
+def available_cores():
+    """CPU ids this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class JobAllocation:
+    """Live view of the cores assigned to one job; the split changes as other jobs start and finish"""
+
+    def __init__(self, scheduler, job_id):
+        self.scheduler = scheduler
+        self.job_id = job_id
+
+    def cores(self, stage):
+        return self.scheduler.allocation(self.job_id).get(stage, self.scheduler.cores)
+
+    def threads(self, stage):
+        return len(self.cores(stage))
+
+
+class ResourceScheduler:
+    """Splits the machine's cores between running jobs and between the stages of each job.
+
+    Each job gets an even, contiguous slice of the cores, divided between decoding (OpenCV),
+    AU extraction (OpenFace) and inference (TensorFlow) by STAGE_WEIGHTS. Allocations are
+    recomputed whenever a job is registered or released.
+
+    job_source, if given, returns the ids of jobs that other processes on this machine are running
+    (e.g. workers leasing from the job store). They are polled every refresh_interval seconds and
+    get their share of the cores too. Jobs are ordered by id, so every process sharing the same
+    job source assigns the same slice to each job.
+    """
+
+    def __init__(self, cores=None, weights=None, job_source=None, refresh_interval=5.0):
+        self.cores = list(cores or available_cores())
+        self.weights = dict(weights or STAGE_WEIGHTS)
+        self.jobs = []
+        self.allocations = {}
+        self.tensorflow_threads = None
+        self.tensorflow_configured = False
+        self.decode_threads = None
+        self.job_source = job_source
+        self.refresh_interval = refresh_interval
+        self.external_jobs = []
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def _split(self, cores, weights):
+        """Divide cores between weighted parts, giving every part at least one core"""
+        names = list(weights)
+        if len(cores) <= len(names):
+            # Not enough cores for every part to have its own; share them round-robin
+            return {name: [cores[i % len(cores)]] for i, name in enumerate(names)}
+
+        total_weight = sum(weights.values())
+        counts = {name: max(1, int(len(cores) * weights[name] / total_weight)) for name in names}
+        # Hand out the cores lost to rounding, heaviest parts first, or take back any excess
+        by_weight = sorted(names, key=lambda name: -weights[name])
+        i = 0
+        while sum(counts.values()) < len(cores):
+            counts[by_weight[i % len(names)]] += 1
+            i += 1
+        while sum(counts.values()) > len(cores):
+            counts[max(names, key=lambda name: counts[name])] -= 1
+
+        parts = {}
+        start = 0
+        for name in names:
+            parts[name] = cores[start:start + counts[name]]
+            start += counts[name]
+        return parts
+
+    def _rebalance(self):
+        self.allocations = {}
+        if not self.jobs:
+            return
+        jobs = sorted(set(self.jobs) | set(self.external_jobs))
+        job_slices = self._split(self.cores, {job_id: 1 for job_id in jobs})
+        for job_id in self.jobs:
+            self.allocations[job_id] = self._split(job_slices[job_id], self.weights)
+        self._configure_opencv()
+
+    def _configure_opencv(self):
+        """Size OpenCV's thread pool to the decode cores of all jobs of this process.
+
+        The pool is process-wide and shared by every analysis decoding in the process, so it is sized
+        for the jobs together here rather than by each job.
+        """
+        threads = len({core for stages in self.allocations.values() for core in stages["decode"]})
+        if threads == self.decode_threads:
+            return
+        import cv2
+
+        cv2.setNumThreads(threads)
+        self.decode_threads = threads
+
+    def _refresh(self, force=False):
+        """Pick up jobs started or finished by other processes; called with the lock held"""
+        if self.job_source is None:
+            return
+        if not force and self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.refresh_interval:
+            return
+        self.refreshed_at = time.monotonic()
+        try:
+            external_jobs = sorted(self.job_source())
+        except Exception as e:
+            print(f"Warning: Could not read the jobs of other processes: {e}")
+            return
+        if external_jobs != self.external_jobs:
+            self.external_jobs = external_jobs
+            self._rebalance()
+
+    def register(self, job_id):
+        with self.lock:
+            if job_id not in self.jobs:
+                self.jobs.append(job_id)
+                self._refresh(force=True)
+                self._rebalance()
+        return JobAllocation(self, job_id)
+
+    def release(self, job_id):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs.remove(job_id)
+                self._rebalance()
+
+    @contextmanager
+    def job(self, job_id):
+        """Register a job for the duration of the block"""
+        allocation = self.register(job_id)
+        try:
+            yield allocation
+        finally:
+            self.release(job_id)
+
+    def allocation(self, job_id):
+        with self.lock:
+            self._refresh()
+            return dict(self.allocations.get(job_id, {}))
+
+    def configure_tensorflow(self):
+        """Size TensorFlow's thread pools to the inference share of the machine.
+
+        TensorFlow only accepts this before its runtime starts, so unlike the other stages the
+        pool size is fixed for the life of the process, and later calls do nothing.
+        """
+        if self.tensorflow_configured:
+            return
+        self.tensorflow_configured = True
+        import tensorflow as tf
+
+        inference_share = self.weights["inference"] / sum(self.weights.values())
+        threads = max(1, int(len(self.cores) * inference_share))
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+            self.tensorflow_threads = threads
+            print(f"TensorFlow limited to {threads} intra-op threads")
+        except RuntimeError as e:
+            # The runtime was already initialized by an earlier call
+            print(f"Warning: Could not configure TensorFlow threads: {e}")
+
+    def snapshot(self):
+        """Current allocation, for tuning"""
+        with self.lock:
+            return {
+                "cores": self.cores,
+                "weights": self.weights,
+                "tensorflow_threads": self.tensorflow_threads,
+                "decode_threads": self.decode_threads,
+                "other_jobs": list(self.external_jobs),
+                "jobs": {job_id: dict(stages) for job_id, stages in self.allocations.items()}
+            }
+
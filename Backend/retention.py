@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RetentionPolicy:
+    """Limits for one directory: total size in bytes and/or age in seconds (None means no limit)"""
+
+    def __init__(self, max_bytes=None, max_age=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+
+def policies_from_env():
+    """Build the retention policies for Videos, Reports, Reports/faces, the AU cache, job directories and profiles
+    from environment variables"""
+    def env_float(name):
+        value = os.getenv(name)
+        return float(value) if value else None
+
+    policies = {}
+    for directory, prefix in (("Videos", "VIDEOS"), ("Reports", "REPORTS"), (os.path.join("Reports", "faces"), "FACES"),
+                              (os.getenv("AU_CACHE_DIR") or "AU_cache", "AU_CACHE"), (os.getenv("JOBS_DIR") or "Jobs", "JOBS"),
+                              ("Profiles", "PROFILES")):
+        max_mb = env_float(f"RETENTION_{prefix}_MAX_MB")
+        max_age_days = env_float(f"RETENTION_{prefix}_MAX_AGE_DAYS")
+        policies[directory] = RetentionPolicy(
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb is not None else None,
+            max_age=max_age_days * 24 * 3600 if max_age_days is not None else None
+        )
+    return policies
+
+
+class RetentionManager:
+    """Keeps directories within their quotas by evicting old and least recently used files.
+
+    Files are first removed once they are older than the directory's max_age; if the directory is
+    still over max_bytes, the least recently used files are removed until it fits. Pinned paths,
+    and paths returned by any of the pin_sources callables, are never removed; pinning a directory
+    protects every file under it. Subdirectories left empty by a sweep are removed as well.
+    """
+
+    def __init__(self, policies, interval=600, pin_sources=None):
+        self.policies = policies
+        self.interval = interval
+        self.pin_sources = list(pin_sources or [])
+        self.pins = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stats = {"sweeps": 0, "files_removed": 0, "bytes_reclaimed": 0, "last_sweep": None, "directories": {}}
+
+    def pin(self, path):
+        with self.lock:
+            path = os.path.abspath(path)
+            self.pins[path] = self.pins.get(path, 0) + 1
+
+    def unpin(self, path):
+        with self.lock:
+            path = os.path.abspath(path)
+            if self.pins.get(path, 0) <= 1:
+                self.pins.pop(path, None)
+            else:
+                self.pins[path] -= 1
+
+    @contextmanager
+    def pinned(self, *paths):
+        """Protect files from eviction while they are in use"""
+        for path in paths:
+            self.pin(path)
+        try:
+            yield
+        finally:
+            for path in paths:
+                self.unpin(path)
+
+    def _pinned_paths(self):
+        with self.lock:
+            pinned = set(self.pins)
+        for source in self.pin_sources:
+            try:
+                pinned.update(os.path.abspath(path) for path in source() if path)
+            except Exception as e:
+                print(f"Warning: Could not read pinned files: {e}")
+        return pinned
+
+    def _is_pinned(self, path, pinned):
+        """Whether path or one of the directories containing it is pinned"""
+        while path not in pinned:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+        return True
+
+    def _list_files(self, directory):
+        """Files under directory, leaving out subdirectories that have their own policy"""
+        managed = {os.path.abspath(other) for other in self.policies if other != directory}
+        files = []
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in managed]
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Last use is the later of access and modification, since many filesystems disable atime updates
+                files.append((os.path.abspath(path), stat.st_size, max(stat.st_atime, stat.st_mtime)))
+        return files
+
+    def _remove(self, path, size, directory_stats):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Warning: Could not remove {path}: {e}")
+            return 0
+        directory_stats["files_removed"] += 1
+        directory_stats["bytes_reclaimed"] += size
+        return size
+
+    def _remove_empty_directories(self, directory, pinned):
+        """Remove subdirectories with no files left (e.g. an expired job's folder), keeping the policy directory"""
+        managed = {os.path.abspath(other) for other in self.policies}
+        for root, dirs, names in os.walk(directory, topdown=False):
+            path = os.path.abspath(root)
+            if path in managed or names or self._is_pinned(path, pinned):
+                continue
+            try:
+                os.rmdir(path)
+            except OSError:
+                # Not empty: a subdirectory is still in use, or a file was just written to it
+                pass
+
+    def sweep(self):
+        """Enforce all policies once and return what was reclaimed"""
+        now = time.time()
+        pinned = self._pinned_paths()
+        sweep_stats = {}
+
+        for directory, policy in self.policies.items():
+            if not os.path.isdir(directory):
+                continue
+            directory_stats = {"files_removed": 0, "bytes_reclaimed": 0}
+            all_files = self._list_files(directory)
+            total_bytes = sum(size for _, size, _ in all_files)
+            files = [entry for entry in all_files if not self._is_pinned(entry[0], pinned)]
+
+            # Age-based eviction
+            if policy.max_age is not None:
+                expired = [entry for entry in files if now - entry[2] > policy.max_age]
+                for path, size, _ in expired:
+                    total_bytes -= self._remove(path, size, directory_stats)
+                files = [entry for entry in files if now - entry[2] <= policy.max_age]
+
+            # Quota eviction, least recently used first
+            if policy.max_bytes is not None and total_bytes > policy.max_bytes:
+                for path, size, _ in sorted(files, key=lambda entry: entry[2]):
+                    if total_bytes <= policy.max_bytes:
+                        break
+                    total_bytes -= self._remove(path, size, directory_stats)
+                if total_bytes > policy.max_bytes:
+                    print(f"Warning: {directory} is still over its quota; the remaining files are pinned")
+
+            if directory_stats["files_removed"]:
+                self._remove_empty_directories(directory, pinned)
+
+            directory_stats["bytes_used"] = total_bytes
+            sweep_stats[directory] = directory_stats
+
+        with self.lock:
+            self.stats["sweeps"] += 1
+            self.stats["last_sweep"] = now
+            for directory, directory_stats in sweep_stats.items():
+                self.stats["files_removed"] += directory_stats["files_removed"]
+                self.stats["bytes_reclaimed"] += directory_stats["bytes_reclaimed"]
+                totals = self.stats["directories"].setdefault(directory, {"files_removed": 0, "bytes_reclaimed": 0})
+                totals["files_removed"] += directory_stats["files_removed"]
+                totals["bytes_reclaimed"] += directory_stats["bytes_reclaimed"]
+                totals["bytes_used"] = directory_stats["bytes_used"]
+
+        reclaimed = sum(directory_stats["bytes_reclaimed"] for directory_stats in sweep_stats.values())
+        if reclaimed:
+            print(f"Retention sweep reclaimed {reclaimed / (1024 * 1024):.1f} MB")
+        return sweep_stats
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics["directories"] = {directory: dict(values) for directory, values in self.stats["directories"].items()}
+        metrics["policies"] = {
+            directory: {"max_bytes": policy.max_bytes, "max_age_seconds": policy.max_age}
+            for directory, policy in self.policies.items()
+        }
+        return metrics
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error during retention sweep: {e}")
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        """Start the background sweeper thread"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="retention-sweeper", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
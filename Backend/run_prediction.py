@@ -1,69 +1,196 @@
-from Model.ModelPredictor import EnsemblePredictor
-from Model.PreProcessing.AUsGenerator import extract_and_process_chunks
+from Model.ModelPredictor import EnsemblePredictor, metadata_filename, summarize_results
+from Model.PreProcessing.AUsGenerator import extract_and_process_chunks, iter_frame_chunks, process_chunk_for_AUs, chunk_csv_filename, resample_start
+from Model.PreProcessing.FaceCropper import FaceCropper
+from Model.PreProcessing.ExtractionProfile import ExtractionProfile, TRAINING_AU_COLUMNS
+from Model.Profiler import profiled, span
+from stage_pipeline import StagePipeline
+from au_cache import AUCache
+from inference_server import RemotePredictor
 import os
+import math
 import shutil
+import threading
+import uuid
 import glob
 import pandas as pd
 import numpy as np
+import cv2
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# The exact 32 AUs the ensemble was trained on
+REQUIRED_AU_COLUMNS = TRAINING_AU_COLUMNS
+
+
+# Loaded ensembles, kept for the life of the process so models are loaded, traced and warmed up only once
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+
+def load_predictor(precision="float32", cascade=False):
+    """Shared EnsemblePredictor for the given precision and cascade mode.
+    
+    The predictor keeps no per-analysis state, so concurrent analyses can use it at the same time. Analyses
+    that ask for it while it is being loaded wait for that load instead of loading it again.
+    With INFERENCE_SERVER_ADDRESS set, the models are served by inference_server.py and only a client is created here."""
+    address = os.getenv("INFERENCE_SERVER_ADDRESS")
+    key = (precision, cascade, address)
+    with _predictors_lock:
+        if key not in _predictors:
+            if address:
+                _predictors[key] = RemotePredictor(address, precision=precision, cascade=cascade)
+            else:
+                _predictors[key] = EnsemblePredictor(precision=precision, cascade=cascade)
+        return _predictors[key]
+
 
 class DeceptionDetector:
-    def __init__(self):
+    def __init__(self, target_fps=30, min_face_confidence=0.5, min_face_coverage=0.5, crop_faces=True, crop_size=480, work_dir=".", output_dir=".", model_precision=None, cascade=False, scheduler=None, decode_workers=None, au_cache_dir=None):
+        # Working directories are kept under work_dir so several detectors can run side by side
+        self.temp_img_folder = os.path.join(work_dir, "temp_image")
+        self.au_output_folder = os.path.join(work_dir, "AU_output")
+        self.combined_data_folder = os.path.join(work_dir, "combined_data")
+        
         # Create necessary directories
-        os.makedirs("temp_image", exist_ok=True)
-        os.makedirs("AU_output", exist_ok=True)
-        os.makedirs("combined_data", exist_ok=True)
+        os.makedirs(self.temp_img_folder, exist_ok=True)
+        os.makedirs(self.au_output_folder, exist_ok=True)
+        os.makedirs(self.combined_data_folder, exist_ok=True)
+        
+        # Output files of the analysis
+        os.makedirs(output_dir, exist_ok=True)
+        self.results_file = os.path.join(output_dir, "prediction_results.csv")
+        self.plot_file = os.path.join(output_dir, "deception_analysis.png")
         
         # OpenFace path for Windows
         self.openface_executable = os.getenv("OPENFACE_PATH")
         
-    def process_video(self, video_path, cleanup=True):
+        # Precision of the ensemble models: float32 (default), or a float16/int8 variant created by ModelConverter
+        self.model_precision = model_precision or os.getenv("MODEL_PRECISION") or "float32"
+        
+        # Stop evaluating ensemble members for a window once its classification is settled
+        self.cascade = cascade
+        
+        # Optional ResourceScheduler that assigns each analysis a share of the CPU cores
+        self.scheduler = scheduler
+        self.last_pipeline_stats = None
+        if scheduler is not None:
+            scheduler.configure_tensorflow()
+        
+        # Frame rate the ensemble was trained on; each chunk of this many frames covers one second
+        self.target_fps = target_fps
+        
+        # A frame counts as containing a face if OpenFace tracked it with at least this confidence,
+        # and a window is only scored if at least min_face_coverage of its frames contain a face
+        self.min_face_confidence = min_face_confidence
+        self.min_face_coverage = min_face_coverage
+        
+        # Crop frames to the face region and downsize them to at most crop_size pixels before extraction
+        self.crop_faces = crop_faces
+        self.crop_size = crop_size
+        
+        # Decode long videos as segments in this many worker processes (1 decodes on a single thread)
+        self.decode_workers = decode_workers or int(os.getenv("DECODE_WORKERS") or 1)
+        
+        # Action Units of time-range analyses are cached per video, so overlapping ranges are extracted once
+        self.au_cache = AUCache(au_cache_dir or os.getenv("AU_CACHE_DIR") or "AU_cache")
+        self.analyzed_range = None
+        
+        # OpenFace computes only the output groups holding the model's features, unless
+        # OPENFACE_EXTRACTION_PROFILE=full asks for everything (e.g. to inspect gaze or landmarks)
+        full_extraction = (os.getenv("OPENFACE_EXTRACTION_PROFILE") or "model").lower() == "full"
+        self.extraction_profile = ExtractionProfile.from_metadata(
+            os.path.join("Model/Models/", metadata_filename(self.model_precision)), full=full_extraction
+        )
+        print(f"OpenFace extraction profile: {self.extraction_profile.describe()}")
+        
+    def process_video(self, video_path, cleanup=True, stream=False, pipelined=False, start_time=None, end_time=None, job_id=None):
+        """Analyze a video. Returns the chunk-wise results DataFrame, or a summary dict in streaming mode.
+        
+        In pipelined mode decoding, AU extraction and inference run concurrently (which implies streaming).
+        With start_time and/or end_time (seconds) only that part of the video is analyzed.
+        job_id names the analysis in the scheduler, e.g. the job store id of a queued job."""
         if not os.path.exists(video_path):
             print(f"Error: Video file not found at {video_path}")
             return None
         
+        allocation = None
+        if self.scheduler is not None:
+            job_id = job_id or f"{os.path.basename(video_path)}-{uuid.uuid4().hex[:6]}"
+            allocation = self.scheduler.register(job_id)
+        
         try:
             # Clear previous AU_output contents to prevent duplication
-            self._clear_directory("AU_output")
+            self._clear_directory(self.au_output_folder)
             
-            # Step 1: Extract Action Units from video using OpenFace
-            print(f"Step 1: Extracting Action Units from {video_path}")
-            extract_and_process_chunks(
-                video_path=video_path,
-                chunk_size=30,
-                temp_img_folder="temp_image",
-                openface_executable=self.openface_executable,
-                output_folder="AU_output"  # This will be used as the base directory, no nesting
-            )
-            print("Action Units extraction complete")
+            frame_transform = FaceCropper(max_size=self.crop_size) if self.crop_faces else None
+            self.analyzed_range = None
             
-            # Step 2: Combine AU files
-            print("Step 2: Combining extracted Action Units")
-            self._combine_and_clean_aus()
+            if start_time is not None or end_time is not None:
+                results = self._process_range(video_path, start_time, end_time, allocation)
+            elif pipelined:
+                # Load the models first, since inference starts as soon as the first AUs are extracted
+                print("Initializing deception predictor...")
+                predictor = self.load_predictor()
+                
+                print(f"Decoding, extracting Action Units and detecting deception concurrently on {video_path}")
+                results = self._process_pipelined(video_path, predictor, frame_transform, allocation)
+            else:
+                # Step 1: Extract Action Units from video using OpenFace
+                print(f"Step 1: Extracting Action Units from {video_path}")
+                extract_and_process_chunks(
+                    video_path=video_path,
+                    chunk_size=self.target_fps,
+                    temp_img_folder=self.temp_img_folder,
+                    openface_executable=self.openface_executable,
+                    output_folder=self.au_output_folder,  # This will be used as the base directory, no nesting
+                    target_fps=self.target_fps,
+                    frame_transform=frame_transform,
+                    allocation=allocation,
+                    decode_workers=self.decode_workers,
+                    extraction_flags=self.extraction_profile.flags
+                )
+                print("Action Units extraction complete")
             
-            # Step 3: Run prediction using the ensemble model
-            print("Step 3: Running deception detection")
-            data_file = "combined_data/cleaned_sample_data.csv"
+                # Initialize the predictor
+                print("Initializing deception predictor...")
+                predictor = self.load_predictor()
             
-            # Initialize the predictor
-            print("Initializing deception predictor...")
-            predictor = EnsemblePredictor()
-            
-            # Run prediction on the cleaned data
-            print(f"Running prediction on {data_file}...")
-            results = predictor.predict_from_csv(
-                data_file, 
-                output_file="prediction_results.csv",
-                plot=True,
-                fps=30
-            )
+                if stream:
+                    # Steps 2 and 3 in streaming mode: AU files are cleaned and scored a batch at a time and the
+                    # results are appended to disk, so memory use does not grow with the length of the video
+                    print("Step 2/3: Streaming extracted Action Units through deception detection")
+                    results = predictor.predict_stream(
+                        self._iter_cleaned_aus(),
+                        output_file=self.results_file,
+                        plot=True,
+                        plot_file=self.plot_file,
+                        fps=self.target_fps,
+                        min_face_coverage=self.min_face_coverage
+                    )
+                else:
+                    # Step 2: Combine AU files
+                    print("Step 2: Combining extracted Action Units")
+                    self._combine_and_clean_aus()
+                
+                    # Step 3: Run prediction using the ensemble model
+                    print("Step 3: Running deception detection")
+                    data_file = os.path.join(self.combined_data_folder, "cleaned_sample_data.csv")
+                
+                    # Run prediction on the cleaned data
+                    print(f"Running prediction on {data_file}...")
+                    results = predictor.predict_from_csv(
+                        data_file, 
+                        output_file=self.results_file,
+                        plot=True,
+                        plot_file=self.plot_file,
+                        fps=self.target_fps,
+                        min_face_coverage=self.min_face_coverage
+                    )
             
             print("Analysis complete!")
-            print("- Visualization saved as 'deception_analysis.png'")
-            print("- Detailed results saved as 'prediction_results.csv'")
+            print(f"- Visualization saved as '{self.plot_file}'")
+            print(f"- Detailed results saved as '{self.results_file}'")
             
             # Delete the folders after processing if cleanup is True
             if cleanup:
@@ -74,6 +201,122 @@ class DeceptionDetector:
         except Exception as e:
             print(f"Error during processing: {e}")
             raise e
+        finally:
+            if allocation is not None:
+                self.scheduler.release(allocation.job_id)
+    
+    def load_predictor(self):
+        """Ensemble used by this detector, shared by all detectors in the process"""
+        return load_predictor(self.model_precision, self.cascade)
+    
+    def _process_range(self, video_path, start_time, end_time, allocation):
+        """Score seconds [start_time, end_time) of the video, extracting only the chunks that are not cached yet"""
+        cap = cv2.VideoCapture(video_path)
+        source_fps = cap.get(cv2.CAP_PROP_FPS)
+        source_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if source_fps <= 0:
+            raise ValueError(f"Could not read the frame rate of {video_path}")
+        
+        # Chunk k holds frames [k * chunk_size, (k + 1) * chunk_size) of the resampled video, as in a full analysis
+        chunk_size = self.target_fps
+        video_chunks = resample_start(source_frames, source_fps, self.target_fps) // chunk_size
+        first_chunk = int((start_time or 0) * self.target_fps) // chunk_size
+        last_chunk = video_chunks
+        if end_time is not None:
+            last_chunk = min(video_chunks, math.ceil(end_time * self.target_fps / chunk_size))
+        if first_chunk >= last_chunk:
+            raise ValueError(f"Time range {start_time}-{end_time}s is outside the video ({video_chunks * chunk_size / self.target_fps:.0f}s long)")
+        self.analyzed_range = (first_chunk * chunk_size / self.target_fps, last_chunk * chunk_size / self.target_fps)
+        
+        key = self.au_cache.video_key(video_path, fps=self.target_fps, crop_size=self.crop_size if self.crop_faces else None,
+                                      features=",".join(self.extraction_profile.feature_columns))
+        runs = self.au_cache.missing_runs(key, first_chunk, last_chunk)
+        missing = sum(end - start for start, end in runs)
+        print(f"Analyzing {self.analyzed_range[0]:.0f}s to {self.analyzed_range[1]:.0f}s of {video_path}: "
+              f"{last_chunk - first_chunk - missing} of {last_chunk - first_chunk} chunks already extracted")
+        
+        # Step 1: Extract Action Units for the missing chunks only, seeking straight to each run
+        with span("extract_and_process_chunks"):
+            for run_start, run_end in runs:
+                frame_transform = FaceCropper(max_size=self.crop_size) if self.crop_faces else None
+                for chunk_index, frames in iter_frame_chunks(video_path, chunk_size, self.target_fps, frame_transform, allocation,
+                                                             self.decode_workers, run_start, run_end):
+                    csv_filename = chunk_csv_filename(video_path, chunk_index)
+                    cpu_cores = allocation.cores("extract") if allocation is not None else None
+                    process_chunk_for_AUs(frames, self.temp_img_folder, self.openface_executable, self.au_output_folder, csv_filename, cpu_cores,
+                                          self.extraction_profile.flags)
+                    
+                    csv_file = os.path.join(self.au_output_folder, csv_filename)
+                    if os.path.exists(csv_file):
+                        au_frame = pd.read_csv(csv_file)
+                        au_frame.columns = au_frame.columns.str.strip()
+                        self.extraction_profile.validate(au_frame.columns, csv_file)
+                        os.remove(csv_file)
+                    else:
+                        # OpenFace found nothing; cache the chunk as frames without a subject
+                        au_frame = pd.DataFrame({'success': np.zeros(len(frames))})
+                    columns = [col for col in self.extraction_profile.output_columns if col in au_frame.columns]
+                    self.au_cache.store(key, chunk_index, au_frame[columns])
+        
+        # Step 2: Clean the cached AUs of the range
+        cleaned_df = self._clean_aus(self.au_cache.load(key, first_chunk, last_chunk, chunk_size))
+        os.makedirs(self.combined_data_folder, exist_ok=True)
+        data_file = os.path.join(self.combined_data_folder, "cleaned_sample_data.csv")
+        cleaned_df.to_csv(data_file, index=False, encoding='utf-8-sig')
+        
+        # Step 3: Score the range, with frames and times counted from the start of the video
+        predictor = self.load_predictor()
+        return predictor.predict_from_csv(
+            data_file,
+            output_file=self.results_file,
+            plot=True,
+            plot_file=self.plot_file,
+            fps=self.target_fps,
+            min_face_coverage=self.min_face_coverage,
+            frame_offset=first_chunk * chunk_size
+        )
+    
+    def _process_pipelined(self, video_path, predictor, frame_transform, allocation):
+        """Overlap decoding of chunk N+1, AU extraction of chunk N and inference of chunk N-1"""
+        chunks = iter_frame_chunks(video_path, self.target_fps, self.target_fps, frame_transform, allocation, self.decode_workers)
+        
+        def extract(chunk):
+            chunk_index, frames = chunk
+            csv_filename = chunk_csv_filename(video_path, chunk_index)
+            cpu_cores = allocation.cores("extract") if allocation is not None else None
+            # One span per chunk: extraction overlaps decoding and inference, so there is no single extraction block
+            with span("process_chunk_for_AUs"):
+                process_chunk_for_AUs(frames, self.temp_img_folder, self.openface_executable, self.au_output_folder, csv_filename, cpu_cores,
+                                      self.extraction_profile.flags)
+            return os.path.join(self.au_output_folder, csv_filename), len(frames)
+        
+        pipeline = StagePipeline("decode", chunks, [("extract", extract)], "inference", queue_size=2)
+        
+        def cleaned_chunks():
+            for csv_file, frame_count in pipeline:
+                if not os.path.exists(csv_file):
+                    # Keep the chunk's frames as frames without a subject, so later windows keep their times
+                    print(f"Warning: OpenFace produced no output for {csv_file}")
+                    yield self._clean_aus(pd.DataFrame({'success': np.zeros(frame_count)}), verbose=False)
+                    continue
+                yield self._read_cleaned_aus(csv_file)
+        
+        try:
+            # Small inference batches so scoring keeps up with extraction
+            return predictor.predict_stream(
+                cleaned_chunks(),
+                output_file=self.results_file,
+                plot=True,
+                plot_file=self.plot_file,
+                fps=self.target_fps,
+                min_face_coverage=self.min_face_coverage,
+                batch_windows=8
+            )
+        finally:
+            self.last_pipeline_stats = pipeline.stats()
+            print(f"Pipeline stage times: {self.last_pipeline_stats['stage_busy_seconds']}")
+            print(f"Bottleneck stage: {self.last_pipeline_stats['bottleneck']}")
     
     def _clear_directory(self, directory):
         """Clear contents of directory without removing the directory itself"""
@@ -86,11 +329,10 @@ class DeceptionDetector:
                     shutil.rmtree(item_path)
             print(f"Cleared contents of {directory}")
     
-    def _combine_and_clean_aus(self):
-        au_path = 'AU_output'  # No 'r' prefix to avoid raw string problems
-        
+    def _sorted_au_files(self):
+        """AU CSV files in the output directory, sorted by chunk number"""
         # Get all CSV files from the output directory
-        csv_files = glob.glob(os.path.join(au_path, "*.csv"))
+        csv_files = glob.glob(os.path.join(self.au_output_folder, "*.csv"))
         print(f"Found {len(csv_files)} AU files")
         
         # Sort files by chunk number
@@ -102,6 +344,11 @@ class DeceptionDetector:
                 return float('inf')  # Put files without chunk numbers at the end
         
         csv_files.sort(key=get_chunk_number)
+        return csv_files
+    
+    @profiled("DeceptionDetector._combine_and_clean_aus")
+    def _combine_and_clean_aus(self):
+        csv_files = self._sorted_au_files()
         print("Files will be processed in order:", [os.path.basename(f) for f in csv_files])
         
         # Create a list to store dataframes
@@ -131,34 +378,53 @@ class DeceptionDetector:
         
         # Clean up column names by stripping whitespace
         combined_frame.columns = combined_frame.columns.str.strip()
+        self.extraction_profile.validate(combined_frame.columns)
         
         # Save the combined data
-        if not os.path.exists("combined_data"):
-            os.makedirs("combined_data")
-        combined_frame.to_csv("combined_data/combined_sample_data.csv", index=False, encoding='utf-8-sig')
-        print(f"Combined data saved to combined_data/combined_sample_data.csv")
-        
-        # Define the exact 32 AUs needed
-        required_au_columns = [
-            'AU02_r', 'AU04_r', 'AU05_r', 'AU06_r', 'AU07_r', 'AU09_r',
-            'AU10_r', 'AU12_r', 'AU14_r', 'AU15_r', 'AU17_r', 'AU20_r', 'AU25_r', 'AU26_r', 
-            'AU45_r', 'AU01_c', 'AU02_c', 'AU04_c', 'AU05_c', 'AU06_c', 'AU07_c', 'AU09_c', 
-            'AU10_c', 'AU12_c', 'AU14_c', 'AU15_c', 'AU20_c', 'AU23_c', 'AU25_c', 'AU26_c', 
-            'AU28_c', 'AU45_c'
-        ]
+        os.makedirs(self.combined_data_folder, exist_ok=True)
+        combined_file = os.path.join(self.combined_data_folder, "combined_sample_data.csv")
+        combined_frame.to_csv(combined_file, index=False, encoding='utf-8-sig')
+        print(f"Combined data saved to {combined_file}")
+        
+        cleaned_df = self._clean_aus(combined_frame)
+        
+        # Save the cleaned data
+        cleaned_file = os.path.join(self.combined_data_folder, "cleaned_sample_data.csv")
+        cleaned_df.to_csv(cleaned_file, index=False, encoding='utf-8-sig')
+        print(f"Cleaned data saved to {cleaned_file} with {len(self.extraction_profile.feature_columns)} AU columns")
+    
+    def _iter_cleaned_aus(self):
+        """Yield the cleaned AUs one chunk file at a time, without combining them in memory"""
+        csv_files = self._sorted_au_files()
+        if not csv_files:
+            raise Exception("No data was processed. Check if CSV files exist in the output directory.")
         
+        for filename in csv_files:
+            yield self._read_cleaned_aus(filename)
+    
+    def _read_cleaned_aus(self, filename):
+        df = pd.read_csv(filename, index_col=None, header=0)
+        df.columns = df.columns.str.strip()
+        self.extraction_profile.validate(df.columns, filename)
+        return self._clean_aus(df, verbose=False)
+    
+    def _clean_aus(self, frame, verbose=True):
+        """Keep only the AU columns the model expects, plus a per-frame face presence flag"""
+        feature_columns = self.extraction_profile.feature_columns
         # Check which of the required AUs are available in the data
-        available_au_columns = [col for col in required_au_columns if col in combined_frame.columns]
-        print(f"Found {len(available_au_columns)} of the required {len(required_au_columns)} AU columns")
+        available_au_columns = [col for col in feature_columns if col in frame.columns]
+        if verbose:
+            print(f"Found {len(available_au_columns)} of the required {len(feature_columns)} AU columns")
         
         # For missing columns, create them with zeros
-        missing_columns = set(required_au_columns) - set(available_au_columns)
+        missing_columns = set(feature_columns) - set(available_au_columns)
         for col in missing_columns:
-            combined_frame[col] = 0.0
-            print(f"Added missing column {col} with zeros")
+            frame[col] = 0.0
+            if verbose:
+                print(f"Added missing column {col} with zeros")
         
-        # Create a cleaned dataframe with ONLY the 32 AU columns
-        cleaned_df = combined_frame[required_au_columns]
+        # Create a cleaned dataframe with ONLY the model's AU columns
+        cleaned_df = frame[feature_columns].copy()
         
         # Ensure all data is numeric
         for col in cleaned_df.columns:
@@ -170,19 +436,31 @@ class DeceptionDetector:
         # Ensure all data is float32 (standard for ML models)
         cleaned_df = cleaned_df.astype(np.float32)
         
-        # Save the cleaned data
-        cleaned_df.to_csv("combined_data/cleaned_sample_data.csv", index=False, encoding='utf-8-sig')
-        print(f"Cleaned data saved to combined_data/cleaned_sample_data.csv with exactly {len(cleaned_df.columns)} columns")
+        # Keep a per-frame face presence flag so windows without a subject can skip inference
+        face_present = pd.Series(True, index=frame.index)
+        if 'success' in frame.columns:
+            face_present &= pd.to_numeric(frame['success'], errors='coerce').fillna(0) > 0
+        if 'confidence' in frame.columns:
+            face_present &= pd.to_numeric(frame['confidence'], errors='coerce').fillna(0) >= self.min_face_confidence
+        cleaned_df['face_present'] = face_present.astype(np.float32)
+        if verbose:
+            print(f"Face detected in {face_present.mean() * 100:.1f}% of frames")
+        
+        return cleaned_df
     
     def _cleanup_temp_folders(self):
         """
         Delete temporary folders created during processing
         """
         print("Cleaning up temporary folders...")
-        if os.path.exists("AU_output"):
-            shutil.rmtree("AU_output")
-            print("- AU_output folder deleted")
+        if os.path.exists(self.au_output_folder):
+            shutil.rmtree(self.au_output_folder)
+            print(f"- {self.au_output_folder} folder deleted")
+        
+        if os.path.exists(self.combined_data_folder):
+            shutil.rmtree(self.combined_data_folder)
+            print(f"- {self.combined_data_folder} folder deleted")
         
-        if os.path.exists("combined_data"):
-            shutil.rmtree("combined_data")
-            print("- combined_data folder deleted")
+        if os.path.exists(self.temp_img_folder):
+            shutil.rmtree(self.temp_img_folder)
+            print(f"- {self.temp_img_folder} folder deleted")
@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+
+from Model.Profiler import in_analysis
+
+_DONE = object()
+
+
+class StageQueue:
+    """Bounded queue between two stages that records its occupancy and blocking times"""
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize)
+        self.samples = 0
+        self.occupancy_sum = 0
+        self.max_occupancy = 0
+        self.put_wait = 0.0  # Time the producer spent blocked on a full queue
+        self.get_wait = 0.0  # Time the consumer spent blocked on an empty queue
+
+    def _sample(self):
+        size = self.queue.qsize()
+        self.samples += 1
+        self.occupancy_sum += size
+        self.max_occupancy = max(self.max_occupancy, size)
+
+    def put(self, item, stopped):
+        self._sample()
+        start = time.perf_counter()
+        # Wake up regularly so a stopped pipeline never leaves the producer blocked
+        while not stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.put_wait += time.perf_counter() - start
+
+    def get(self):
+        self._sample()
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.get_wait += time.perf_counter() - start
+        return item
+
+    def stats(self):
+        return {
+            "capacity": self.maxsize,
+            "mean_occupancy": self.occupancy_sum / self.samples if self.samples else 0.0,
+            "max_occupancy": self.max_occupancy,
+            "producer_blocked_seconds": self.put_wait,
+            "consumer_waiting_seconds": self.get_wait
+        }
+
+
+class StagePipeline:
+    """Runs a source and a chain of stages in their own threads, connected by bounded queues.
+
+    Iterating over the pipeline yields the output of the last stage in the caller's thread, which
+    acts as the final stage. While the caller works on item N-1, the stages can already work on
+    items N and N+1; a full queue blocks the stage before it (backpressure). A queue that is
+    mostly full points to a slow consumer after it, one that is mostly empty to a slow producer.
+    """
+
+    def __init__(self, source_name, source, stages, consumer_name="consumer", queue_size=2):
+        self.source_name = source_name
+        self.source = source
+        self.stages = stages  # List of (name, function) applied to each item in order
+        self.consumer_name = consumer_name
+        self.queues = [StageQueue(f"{source_name}->{name}", queue_size) for name, _ in stages]
+        last_stage = stages[-1][0] if stages else source_name
+        self.queues.append(StageQueue(f"{last_stage}->{consumer_name}", queue_size))
+        self.busy = {name: 0.0 for name in [source_name] + [name for name, _ in stages] + [consumer_name]}
+        self.stopped = threading.Event()
+        self.error = None
+        self.threads = []
+
+    def _run_source(self, output):
+        try:
+            iterator = iter(self.source)
+            while not self.stopped.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self.busy[self.source_name] += time.perf_counter() - start
+                output.put(item, self.stopped)
+        except Exception as e:
+            self.error = e
+            self.stopped.set()
+        finally:
+            output.put(_DONE, threading.Event())
+
+    def _run_stage(self, name, function, input_queue, output):
+        try:
+            while True:
+                item = input_queue.get()
+                if item is _DONE or self.stopped.is_set():
+                    break
+                start = time.perf_counter()
+                result = function(item)
+                self.busy[name] += time.perf_counter() - start
+                output.put(result, self.stopped)
+        except Exception as e:
+            self.error = e
+            self.stopped.set()
+        finally:
+            # Drain the input so the stage before can finish
+            while item is not _DONE:
+                item = input_queue.get()
+            output.put(_DONE, threading.Event())
+
+    def __iter__(self):
+        # Stage threads belong to the analysis iterating the pipeline, e.g. for its profile
+        self.threads = [threading.Thread(target=in_analysis(self._run_source), args=(self.queues[0],), name=self.source_name, daemon=True)]
+        for i, (name, function) in enumerate(self.stages):
+            self.threads.append(threading.Thread(
+                target=in_analysis(self._run_stage), args=(name, function, self.queues[i], self.queues[i + 1]), name=name, daemon=True
+            ))
+        for thread in self.threads:
+            thread.start()
+
+        final_queue = self.queues[-1]
+        try:
+            while True:
+                item = final_queue.get()
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                yield item
+                self.busy[self.consumer_name] += time.perf_counter() - start
+        finally:
+            # Stop the other stages if the consumer stopped early or failed
+            self.stopped.set()
+            while item is not _DONE:
+                item = final_queue.get()
+            for thread in self.threads:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """Per-stage busy time and per-queue occupancy; the busiest stage is the bottleneck"""
+        return {
+            "stage_busy_seconds": dict(self.busy),
+            "queues": {stage_queue.name: stage_queue.stats() for stage_queue in self.queues},
+            "bottleneck": max(self.busy, key=self.busy.get)
+        }
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from Model.ModelPredictor import EnsemblePredictor
+
+
+class FixedMember:
+    """Ensemble member whose output for each window is fixed in advance; the window index is in X[:, 0, 0]"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def predict(self, X, batch_size=None, verbose=0):
+        return self.outputs[X[:, 0, 0].astype(int)].reshape(-1, 1)
+
+
+def make_predictor(member_outputs, **kwargs):
+    models = [FixedMember(outputs) for outputs in member_outputs]
+    return EnsemblePredictor(metadata={"s_size": 2, "model_paths": []}, models=models, cascade=True, **kwargs)
+
+
+def windows(count):
+    X = np.zeros((count, 2, 1))
+    X[:, 0, 0] = np.arange(count)
+    return X
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5, 0.7])
+def test_cascade_decisions_match_exact_scores(threshold):
+    rng = np.random.default_rng(0)
+    # Outputs on a 0.1 grid put many exact scores right at the threshold
+    member_outputs = np.round(rng.random((5, 2000)), 1)
+    predictor = make_predictor(member_outputs, cascade_audit=True)
+    X = windows(2000)
+
+    score, binary, _, has_subject, details = predictor.score_windows(X, np.ones(2000), threshold, verbose=False)
+    exact = member_outputs.mean(axis=0)
+
+    assert has_subject.all()
+    assert np.allclose(details["Exact_Deception_Score"], exact)
+    assert np.array_equal(binary, (exact > threshold).astype(int))
+    # Some windows did stop early, so the rule was actually exercised
+    assert details["Members_Evaluated"].min() < 5
+    assert details["Members_Evaluated"].max() == 5
+
+
+def test_cascade_scores_windows_stopped_early_with_the_members_evaluated():
+    member_outputs = np.array([[0.9, 0.1, 0.5], [0.9, 0.1, 0.7], [0.0, 0.0, 0.0]])
+    predictor = make_predictor(member_outputs)
+
+    score, evaluated = predictor.predict_cascade(windows(3), 0.5, verbose=False)
+
+    assert evaluated.tolist() == [2, 2, 3]
+    assert np.allclose(score, [0.9, 0.1, 0.4])
@@ -0,0 +1,99 @@
+import pytest
+
+import job_store
+from job_store import JobStore
+
+
+class Clock:
+    """Stand-in for time.time that only moves when told to"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_store.time, "time", clock)
+    return clock
+
+
+def test_expired_lease_is_taken_over(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=10)
+    job_id = store.enqueue("video.mp4")
+
+    assert store.lease("worker-1")["id"] == job_id
+    assert store.lease("worker-2") is None
+
+    # worker-1 stops sending heartbeats, so the job goes to worker-2 once the lease expires
+    clock.advance(11)
+    job = store.lease("worker-2")
+    assert job["id"] == job_id
+    assert job["worker_id"] == "worker-2"
+    assert job["attempts"] == 2
+
+    # The stale worker can no longer renew or finish the job
+    assert not store.heartbeat(job_id, "worker-1")
+    assert not store.complete(job_id, "worker-1", summary={"windows": 1})
+    assert store.get(job_id)["status"] == "running"
+
+    assert store.complete(job_id, "worker-2", summary={"windows": 2})
+    job = store.get(job_id)
+    assert job["status"] == "done"
+    assert job["summary"] == {"windows": 2}
+
+
+def test_heartbeat_keeps_the_lease(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=10)
+    job_id = store.enqueue("video.mp4")
+    store.lease("worker-1")
+
+    clock.advance(8)
+    assert store.heartbeat(job_id, "worker-1")
+    clock.advance(8)
+    assert store.lease("worker-2") is None
+
+
+def test_failed_job_is_retried_until_max_attempts(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.db"), max_attempts=2, retry_delay=5)
+    job_id = store.enqueue("video.mp4")
+
+    store.lease("worker-1")
+    store.fail(job_id, "worker-1", "OpenFace crashed")
+    job = store.get(job_id)
+    assert job["status"] == "queued"
+    assert job["error"] == "OpenFace crashed"
+
+    # The retry waits retry_delay times the attempt number
+    assert store.lease("worker-1") is None
+    clock.advance(6)
+    assert store.lease("worker-1")["attempts"] == 2
+
+    store.fail(job_id, "worker-1", "OpenFace crashed again")
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "OpenFace crashed again"
+    clock.advance(100)
+    assert store.lease("worker-1") is None
+
+
+def test_job_fails_when_its_lease_expires_too_often(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=10, max_attempts=2)
+    job_id = store.enqueue("video.mp4")
+
+    store.lease("worker-1")
+    clock.advance(11)
+    store.lease("worker-2")
+    clock.advance(11)
+
+    assert store.lease("worker-3") is None
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Lease expired too many times"
+    assert not store.complete(job_id, "worker-2")
@@ -0,0 +1,46 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from Model.ModelConverter import ModelConverter
+from Model.ModelPredictor import BucketedModel, metadata_filename
+from Model.PreProcessing.ExtractionProfile import TRAINING_AU_COLUMNS as REQUIRED_AU_COLUMNS
+
+
+def make_ensemble(model_dir, members=2, s_size=30):
+    """Small untrained LSTM ensemble with the metadata layout of the real one"""
+    model_paths = []
+    for i in range(members):
+        model = tf.keras.Sequential([
+            tf.keras.layers.Input((s_size, len(REQUIRED_AU_COLUMNS))),
+            tf.keras.layers.LSTM(4),
+            tf.keras.layers.Dense(1, activation="sigmoid"),
+        ])
+        path = f"model_{i}.h5"
+        model.save(os.path.join(model_dir, path))
+        model_paths.append(path)
+    metadata = {"model_paths": model_paths, "s_size": s_size, "input_shape": (s_size, len(REQUIRED_AU_COLUMNS)), "n_estimators": members}
+    with open(os.path.join(model_dir, metadata_filename()), "wb") as f:
+        pickle.dump(metadata, f)
+
+
+def test_converts_bucketed_ensemble(tmp_path):
+    model_dir = str(tmp_path)
+    make_ensemble(model_dir)
+    reference_csv = os.path.join(model_dir, "reference.csv")
+    rng = np.random.default_rng(0)
+    pd.DataFrame(rng.random((95, len(REQUIRED_AU_COLUMNS))), columns=REQUIRED_AU_COLUMNS).to_csv(reference_csv, index=False)
+
+    converter = ModelConverter(model_dir, tolerance=0.05)
+    assert all(isinstance(model, BucketedModel) for model in converter.reference.models)
+
+    assert converter.convert("float16", reference_csv)
+    with open(os.path.join(model_dir, metadata_filename("float16")), "rb") as f:
+        metadata = pickle.load(f)
+    assert all(os.path.exists(os.path.join(model_dir, path)) for path in metadata["model_paths"])
+    assert metadata["max_score_error"] <= 0.05
@@ -0,0 +1,54 @@
+import math
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("torch")
+
+from Model.PreProcessing.AUsGenerator import resample_count, resample_start
+from Model.PreProcessing.ParallelDecoder import plan_segments
+
+
+@pytest.mark.parametrize("source_fps", [25, 29.97, 30, 50, 60])
+def test_resample_start_maps_every_output_frame_once(source_fps):
+    target_fps = 30
+    source_frames = 600
+    outputs = [resample_start(index, source_fps, target_fps) for index in range(source_frames + 1)]
+
+    assert outputs[0] == 0
+    assert outputs == sorted(outputs)
+    # Output frame k takes the source frame floor(k * source_fps / target_fps)
+    for k in range(outputs[-1]):
+        source_index = math.floor(k * source_fps / target_fps + 1e-9)
+        assert outputs[source_index] <= k < outputs[source_index + 1]
+    assert sum(resample_count(index, source_fps, target_fps) for index in range(source_frames)) == outputs[-1]
+
+
+def test_resample_start_is_global():
+    # A stream starting mid-video is numbered as if it had been resampled from the first frame
+    assert resample_start(0, 60, 30) == 0
+    assert resample_start(1, 60, 30) == 1
+    assert resample_start(3000, 60, 30) == 1500
+    assert resample_start(3001, 60, 30) == 1501
+    assert resample_count(3000, 60, 30) == 1
+    assert resample_count(3001, 60, 30) == 0
+    assert resample_count(100, 15, 30) == 2
+
+
+def test_plan_segments_splits_evenly():
+    assert plan_segments(100, 4) == [(0, 25), (25, 50), (50, 75), (75, None)]
+    assert plan_segments(100, 3, start_frame=10, end_frame=40) == [(10, 20), (20, 30), (30, 40)]
+    assert plan_segments(100, 1, start_frame=10, end_frame=40) == [(10, 40)]
+
+
+def test_plan_segments_snaps_to_nearby_keyframes():
+    keyframes = [0, 24, 48, 90]
+    assert plan_segments(100, 4, keyframes=keyframes) == [(0, 24), (24, 48), (48, 90), (90, None)]
+    # Keyframes further than snap_distance from a boundary are ignored
+    assert plan_segments(100, 4, keyframes=keyframes, snap_distance=5) == [(0, 24), (24, 48), (48, 75), (75, None)]
+
+
+def test_plan_segments_drops_repeated_boundaries():
+    # Two boundaries snapping to the same keyframe give one segment, not an empty one
+    assert plan_segments(100, 4, keyframes=[0, 40]) == [(0, 40), (40, None)]
+    assert plan_segments(100, 4, start_frame=0, end_frame=2) == [(0, 1), (1, 2)]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from timeline import lttb_indices, query_timeline
+
+
+def make_results(rows=1000):
+    """Prediction results with a single score peak and a span without a subject, 40% and 70% of the way through"""
+    scores = np.full(rows, 0.3)
+    scores[rows * 4 // 10] = 0.95
+    scores[rows * 7 // 10:rows * 72 // 100] = np.nan
+    return pd.DataFrame({
+        "Chunk_Start_Time": np.arange(rows, dtype=float),
+        "Deception_Score": scores,
+    })
+
+
+def test_pages_cover_the_range():
+    data = make_results(250)
+    pages = [query_timeline(data, page=page, page_size=100) for page in range(3)]
+
+    assert [meta["rows"] for _, meta in pages] == [100, 100, 50]
+    assert all(meta["pages"] == 3 and meta["total_rows"] == 250 for _, meta in pages)
+    combined = pd.concat([page for page, _ in pages])
+    assert combined["Chunk_Start_Time"].tolist() == data["Chunk_Start_Time"].tolist()
+
+
+def test_page_of_time_range():
+    data = make_results(250)
+    page, meta = query_timeline(data, start_time=100, end_time=199, page=1, page_size=30)
+
+    assert meta["total_rows"] == 100
+    assert meta["pages"] == 4
+    assert page["Chunk_Start_Time"].tolist() == list(np.arange(130.0, 160.0))
+
+    empty, meta = query_timeline(data, start_time=100, end_time=199, page=5, page_size=30)
+    assert len(empty) == 0 and meta["rows"] == 0
+
+
+def test_downsampling_keeps_peaks_and_no_subject_spans():
+    data = make_results()
+    sampled, meta = query_timeline(data, max_points=50)
+
+    assert meta["downsampled"]
+    assert meta["total_rows"] == 1000
+    assert len(sampled) == 50
+    times = sampled["Chunk_Start_Time"].tolist()
+    assert times == sorted(times)
+    assert times[0] == 0 and times[-1] == 999
+    assert 400 in times
+    assert sampled["Deception_Score"].isna().any()
+
+
+def test_no_downsampling_below_max_points():
+    data = make_results(100)
+    sampled, meta = query_timeline(data, max_points=100)
+
+    assert "downsampled" not in meta
+    assert len(sampled) == 100
+
+
+def test_lttb_needs_three_points():
+    with pytest.raises(ValueError):
+        lttb_indices(np.arange(10), np.zeros(10), 2)
@@ -0,0 +1,110 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Column used as the time axis of the prediction timeline
+TIME_COLUMN = "Chunk_Start_Time"
+
+# Parsed results files, keyed by path and invalidated when the file changes
+_cache = {}
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+
+
+def read_results(results_path):
+    """Read a prediction results CSV, reusing the parsed DataFrame while the file is unchanged"""
+    stat = os.stat(results_path)
+    key = (os.path.abspath(results_path), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+
+    data = pd.read_csv(results_path)
+    with _cache_lock:
+        for cached in [cached for cached in _cache if cached[0] == key[0]]:
+            del _cache[cached]
+        if len(_cache) >= _CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+        _cache[key] = data
+    return data
+
+
+def lttb_indices(x, y, n_out):
+    """Row positions kept by largest-triangle-three-buckets downsampling to n_out points.
+
+    The first and last points are always kept; every bucket in between contributes the point that
+    forms the largest triangle with the point kept from the previous bucket and the average of the
+    next bucket, which preserves peaks and sudden changes that plain decimation would drop.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        raise ValueError("Downsampling needs at least 3 output points")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket, or the last point for the final bucket
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def query_timeline(data, start_time=None, end_time=None, page=None, page_size=1000, max_points=None):
+    """Select a time range, then a page or a downsampled view, of a prediction results DataFrame.
+
+    Returns the selected rows and a dict describing the selection. Chunks without a subject have no
+    score; they are downsampled as a score of -1 so the edges of no-subject spans are kept.
+    """
+    if start_time is not None:
+        data = data[data[TIME_COLUMN] >= start_time]
+    if end_time is not None:
+        data = data[data[TIME_COLUMN] <= end_time]
+    total_rows = len(data)
+
+    meta = {"total_rows": total_rows}
+    if page is not None:
+        data = data.iloc[page * page_size:(page + 1) * page_size]
+        meta.update({"page": page, "page_size": page_size, "pages": -(-total_rows // page_size)})
+
+    if max_points is not None and len(data) > max_points:
+        scores = data["Deception_Score"].fillna(-1).to_numpy()
+        data = data.iloc[lttb_indices(data[TIME_COLUMN].to_numpy(), scores, max_points)]
+        meta["downsampled"] = True
+
+    meta["rows"] = len(data)
+    return data, meta
+
+
+def to_records(data):
+    """Row-wise JSON encoding, with NaN sent as null"""
+    return data.astype(object).where(pd.notnull(data), None).to_dict(orient="records")
+
+
+def to_columns(data):
+    """Compact columnar JSON encoding: one list of values per column, with NaN sent as null"""
+    return {
+        "columns": list(data.columns),
+        "values": {
+            column: data[column].astype(object).where(pd.notnull(data[column]), None).tolist()
+            for column in data.columns
+        }
+    }
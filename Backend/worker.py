@@ -0,0 +1,143 @@
+import os
+import shutil
+import socket
+import threading
+import traceback
+import uuid
+
+from dotenv import load_dotenv
+
+from job_store import JobStore
+from resource_scheduler import ResourceScheduler
+
+load_dotenv()
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOBS_DIR = os.getenv("JOBS_DIR", "Jobs")
+
+
+class JobWorker:
+    """Leases video analysis jobs from the job store and runs them one at a time"""
+
+    def __init__(self, store, jobs_dir=JOBS_DIR, worker_id=None, poll_interval=2.0):
+        self.store = store
+        self.jobs_dir = jobs_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_interval = poll_interval
+        # Renew the lease well before it expires
+        self.heartbeat_interval = max(1.0, store.lease_seconds / 3)
+        self.stopped = threading.Event()
+        # Shares the cores with the jobs of the other workers on this host, re-split as they start and finish
+        host_prefix = f"{socket.gethostname()}-"
+        self.scheduler = ResourceScheduler(job_source=lambda: store.running_job_ids(host_prefix))
+
+    def run(self):
+        # Load and warm up the ensemble once; every job reuses it. TensorFlow's thread pools can only be
+        # sized before its runtime starts, so that comes first.
+        from run_prediction import load_predictor
+        self.scheduler.configure_tensorflow()
+        load_predictor(os.getenv("MODEL_PRECISION") or "float32")
+        
+        print(f"Worker {self.worker_id} polling {self.store.db_path}")
+        while not self.stopped.is_set():
+            job = self.store.lease(self.worker_id)
+            if job is None:
+                self.stopped.wait(self.poll_interval)
+                continue
+            self.process_job(job)
+
+    def stop(self):
+        self.stopped.set()
+
+    def _send_heartbeats(self, job_id, done):
+        while not done.wait(self.heartbeat_interval):
+            if not self.store.heartbeat(job_id, self.worker_id):
+                print(f"Warning: Lost the lease on job {job_id}")
+                return
+
+    def process_job(self, job):
+        # Imported here so the API process can import this module without loading TensorFlow
+        from run_prediction import DeceptionDetector, summarize_results
+        from Model.ReportGenerator import ReportGenerator
+        from Model.Profiler import Profiler, should_profile
+
+        job_id = job["id"]
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        work_dir = os.path.join(job_dir, "work")
+        print(f"Processing job {job_id} (attempt {job['attempts']}): {job['video_path']}")
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._send_heartbeats, args=(job_id, done), daemon=True)
+        heartbeat.start()
+        
+        # Profile on request, or for a sample of jobs (PROFILE_SAMPLE_PERCENT)
+        profiler = None
+        if should_profile(job["options"].get("profile", False)):
+            profiler = Profiler()
+            profiler.start()
+        try:
+            detector = DeceptionDetector(work_dir=work_dir, output_dir=job_dir, scheduler=self.scheduler)
+            results = detector.process_video(
+                job["video_path"],
+                stream=job["options"].get("stream", False),
+                pipelined=job["options"].get("pipelined", False),
+                start_time=job["options"].get("start_time"),
+                end_time=job["options"].get("end_time"),
+                job_id=job_id
+            )
+            if results is None:
+                raise RuntimeError(f"Video file not found: {job['video_path']}")
+
+            report_generator = ReportGenerator(reports_dir=job_dir)
+            report_path = report_generator.generate_report(
+                file_path=job["video_path"],
+                results=results,
+                analysis_image_path=detector.plot_file,
+                time_range=detector.analyzed_range
+            )
+
+            if profiler is not None:
+                # Save the profile before the job is marked done, so it can be downloaded right away
+                profiler.stop()
+                profiler.save(os.path.join(job_dir, "profile"))
+                profiler = None
+
+            summary = summarize_results(results)
+            if detector.last_pipeline_stats is not None:
+                # Stage busy times and queue occupancy of a pipelined analysis, as /pipeline-stats reports for /report
+                summary["pipeline"] = detector.last_pipeline_stats
+
+            done.set()
+            if not self.store.complete(job_id, self.worker_id, detector.results_file, report_path, summary):
+                print(f"Warning: Job {job_id} was taken over by another worker, discarding results")
+            else:
+                print(f"Job {job_id} complete")
+        except Exception as e:
+            done.set()
+            print(f"Error processing job {job_id}: {e}")
+            print(traceback.format_exc())
+            self.store.fail(job_id, self.worker_id, str(e))
+        finally:
+            if profiler is not None:
+                # Keep the profile of a failed attempt too
+                profiler.stop()
+                profiler.save(os.path.join(job_dir, "profile"))
+            heartbeat.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Process queued video analyses from the job store")
+    parser.add_argument("--db", default=JOB_DB_PATH, help=f"Path of the job database (default: {JOB_DB_PATH})")
+    parser.add_argument("--jobs-dir", default=JOBS_DIR, help=f"Directory for job results and reports (default: {JOBS_DIR})")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to wait when the queue is empty (default: 2)")
+
+    args = parser.parse_args()
+
+    worker = JobWorker(JobStore(args.db), jobs_dir=args.jobs_dir, poll_interval=args.poll_interval)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        print("Worker stopped")
@@ -178,7 +178,7 @@ function VideoUpload() {
 
   const fetchPredictionData = async () => {
     try {
-      const response = await fetch("http://localhost:8000/prediction-data");
+      const response = await fetch("http://localhost:8000/prediction-data?max_points=2000");
       if (!response.ok) {
         throw new Error("Failed to fetch prediction data");
       }
@@ -191,8 +191,9 @@ function VideoUpload() {
           Chunk_Start_Time: parseFloat(item.Chunk_Start_Time),
           Chunk_End_Time: parseFloat(item.Chunk_End_Time),
           Time_Seconds: parseFloat(item.Time_Seconds),
-          Deception_Score: parseFloat(item.Deception_Score),
-          Confidence: parseFloat(item.Confidence),
+          // Chunks without a visible subject have no score (null) and a Binary_Prediction of -1
+          Deception_Score: item.Deception_Score == null ? null : parseFloat(item.Deception_Score),
+          Confidence: item.Confidence == null ? null : parseFloat(item.Confidence),
           Binary_Prediction: parseInt(item.Binary_Prediction),
           // Add a VideoTime property that matches video playback time
           VideoTime: parseFloat(item.Chunk_Start_Time)
@@ -265,13 +266,26 @@ function VideoUpload() {
   const currentDataPoint = getCurrentDataPoint();
   const currentChunkIndex = getCurrentChunkIndex();
 
+  // A chunk is only scored if a subject was visible in it
+  const isScored = (item) => item.Binary_Prediction !== -1 && item.Deception_Score != null && !isNaN(item.Deception_Score);
+  const predictionLabel = (item) => !isScored(item) ? 'No subject' : item.Binary_Prediction === 1 ? 'Deceptive' : 'Truthful';
+  const predictionBadge = (item) => !isScored(item) ? 'bg-secondary' : item.Binary_Prediction === 1 ? 'bg-danger' : 'bg-success';
+
+  // Summary over the scored chunks only
+  const scoredData = predictionData ? predictionData.filter(isScored) : [];
+  const deceptiveCount = scoredData.filter(item => item.Binary_Prediction === 1).length;
+  const averageScore = scoredData.length > 0
+    ? scoredData.reduce((sum, item) => sum + item.Deception_Score, 0) / scoredData.length
+    : null;
+
   // Prepare chart data
   const chartData = {
     labels: predictionData ? predictionData.map(item => item.VideoTime) : [],
     datasets: [
       {
         label: 'Deception Score',
-        data: predictionData ? predictionData.map(item => item.Deception_Score) : [],
+        // No-subject chunks are null, which leaves a gap in the line
+        data: predictionData ? predictionData.map(item => isScored(item) ? item.Deception_Score : null) : [],
         borderColor: 'rgb(255, 99, 132)',
         backgroundColor: 'rgba(255, 99, 132, 0.5)',
         pointRadius: predictionData 
@@ -281,6 +295,7 @@ function VideoUpload() {
           : [],
         pointBackgroundColor: predictionData
           ? predictionData.map(item => 
+              !isScored(item) ? 'rgba(128, 128, 128, 0.8)' :
               item.Binary_Prediction === 1 ? 'rgba(255, 0, 0, 0.8)' : 'rgba(0, 255, 0, 0.8)')
           : [],
         pointBorderColor: predictionData
@@ -321,8 +336,12 @@ function VideoUpload() {
           label: function(context) {
             const dataPoint = predictionData[context.dataIndex];
             const label = [];
+            if (!isScored(dataPoint)) {
+              label.push('Prediction: No subject');
+              return label;
+            }
             label.push(`Deception Score: ${context.parsed.y.toFixed(4)}`);
-            label.push(`Prediction: ${dataPoint.Binary_Prediction === 0 ? 'Truthful' : 'Deceptive'}`);
+            label.push(`Prediction: ${predictionLabel(dataPoint)}`);
             label.push(`Confidence: ${(dataPoint.Confidence * 100).toFixed(2)}%`);
             return label;
           }
@@ -507,13 +526,15 @@ function VideoUpload() {
                         <h5 className="mb-0">Video Player</h5>
                         {currentDataPoint && (
                           <div className="d-flex align-items-center">
-                            <div className={`badge ${currentDataPoint.Binary_Prediction === 0 ? 'bg-success' : 'bg-danger'} me-2`}
+                            <div className={`badge ${predictionBadge(currentDataPoint)} me-2`}
                               style={{fontSize: '1rem', padding: '0.5rem'}}>
-                              {currentDataPoint.Binary_Prediction === 0 ? 'Truthful' : 'Deceptive'}
-                            </div>
-                            <div className="small text-muted">
-                              Confidence: {(currentDataPoint.Confidence * 100).toFixed(1)}%
+                              {predictionLabel(currentDataPoint)}
                             </div>
+                            {isScored(currentDataPoint) && (
+                              <div className="small text-muted">
+                                Confidence: {(currentDataPoint.Confidence * 100).toFixed(1)}%
+                              </div>
+                            )}
                           </div>
                         )}
                       </div>
@@ -563,6 +584,10 @@ function VideoUpload() {
                               <span className="d-inline-block me-2" style={{ width: '15px', height: '15px', backgroundColor: 'rgba(255, 0, 0, 0.8)', borderRadius: '50%' }}></span>
                               <span className="small">Deceptive</span>
                             </div>
+                            <div>
+                              <span className="d-inline-block me-2" style={{ width: '15px', height: '15px', backgroundColor: 'rgba(128, 128, 128, 0.8)', borderRadius: '50%' }}></span>
+                              <span className="small">No subject</span>
+                            </div>
                             <div>
                               <span className="fw-bold small">Current Time:</span>
                               <span className="small ms-2">{currentTime.toFixed(2)}s</span>
@@ -575,6 +600,8 @@ function VideoUpload() {
                         {videoDuration > 0 && (
                           <div className="small text-muted mt-2 text-center">
                             Video duration: {videoDuration.toFixed(2)}s | Data points: {predictionData?.length || 0} | 
+                            Scored: {scoredData.length} | Deceptive: {deceptiveCount} | 
+                            Average score: {averageScore === null ? 'n/a' : averageScore.toFixed(3)} | 
                             Viewing: {chartVisibleRange.min.toFixed(1)}s - {chartVisibleRange.max.toFixed(1)}s
                           </div>
                         )}